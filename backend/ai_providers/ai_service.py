@@ -1,6 +1,39 @@
 import asyncio
-from typing import Dict, Any, Callable, List
+import logging
+import os
+import time
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Set
+from metrics import (
+    UPSTREAM_CALLS,
+    UPSTREAM_DURATION,
+    UPSTREAM_FIRST_TOKEN,
+    UPSTREAM_TOKEN_RATE,
+    UPSTREAM_TOKENS,
+)
+from .context import (
+    cached_summary,
+    context_budget,
+    estimate_tokens,
+    fit_context,
+    message_tokens,
+    store_summary,
+)
 from .providers import ProviderRegistry
+from .resilience import Resilience
+from .scheduler import Scheduler
+from .singleflight import SingleFlight, request_key
+
+# Identical concurrent requests share one upstream generation
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+# Replace turns dropped from long conversations with a model-written summary
+CONTEXT_SUMMARY = os.getenv("CONTEXT_SUMMARY", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation below in a few short paragraphs. Keep names, "
+    "facts, decisions and open questions; leave out pleasantries.\n\n"
+)
 
 
 class AIService:
@@ -8,6 +41,12 @@ class AIService:
     
     def __init__(self):
         self.registry = ProviderRegistry
+        self._summarizing: Set[str] = set()
+        # The loop only keeps weak references to tasks
+        self._summary_tasks: Set[asyncio.Task] = set()
+        self.flights = SingleFlight()
+        self.scheduler = Scheduler()
+        self.resilience = Resilience()
     
     def _map_model_id_to_provider_id(self, model_id: str) -> str:
         """
@@ -27,6 +66,202 @@ class AIService:
         }
         return mapping.get(model_id.lower(), model_id.lower())
     
+    def _fit_context(
+        self,
+        messages: List[Dict[str, str]],
+        provider_id: str,
+        api_key: str,
+        model: str,
+        conversation_id: Optional[Any],
+        user_id: Optional[str]
+    ) -> List[Dict[str, str]]:
+        """
+        Trim the oldest turns so the prompt fits the model's context budget
+        
+        When CONTEXT_SUMMARY is on, turns dropped from a stored conversation
+        are summarized in the background; later turns send the summary in
+        their place without waiting for it.
+        """
+        key = str(conversation_id) if conversation_id is not None else None
+        fitted, pinned, start = fit_context(messages, context_budget(model), key)
+        
+        if CONTEXT_SUMMARY and key is not None and start > pinned:
+            summary = cached_summary(key)
+            if (summary is None or summary[0] < start) and key not in self._summarizing:
+                self._summarizing.add(key)
+                task = asyncio.create_task(
+                    self._summarize(
+                        key, messages[:start], pinned, provider_id, api_key, model, user_id
+                    )
+                )
+                self._summary_tasks.add(task)
+                task.add_done_callback(self._summary_done)
+        return fitted
+    
+    def _summary_done(self, task: asyncio.Task) -> None:
+        self._summary_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Conversation summary task failed", exc_info=task.exception())
+    
+    async def _summarize(
+        self,
+        key: str,
+        dropped: List[Dict[str, str]],
+        pinned: int,
+        provider_id: str,
+        api_key: str,
+        model: str,
+        user_id: Optional[str]
+    ) -> None:
+        """Fold the newly dropped turns into the conversation's rolling summary"""
+        try:
+            covered, previous = cached_summary(key) or (pinned, "")
+            transcript = "\n".join(
+                f"{message['role']}: {message['content']}" for message in dropped[covered:]
+            )
+            if previous:
+                transcript = f"Summary so far:\n{previous}\n\n{transcript}"
+            # Keep the summary request itself inside the model's budget
+            transcript = transcript[-context_budget(model) * 4:]
+            
+            provider_id = self._map_model_id_to_provider_id(provider_id)
+            text = await self._scheduled_generate(
+                provider_id,
+                model,
+                api_key,
+                user_id,
+                [{"role": "user", "content": SUMMARY_INSTRUCTION + transcript}],
+            )
+            store_summary(key, len(dropped), text)
+        except Exception as e:
+            logger.warning(
+                "Conversation summary failed: %s", e, extra={"provider": provider_id}
+            )
+        finally:
+            self._summarizing.discard(key)
+    
+    async def _scheduled_stream(
+        self,
+        provider_id: str,
+        model: str,
+        api_key: str,
+        user_id: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        """Stream from the pooled provider once the scheduler grants an upstream slot"""
+        prompt_tokens = sum(map(message_tokens, messages))
+        labels = {"provider": provider_id, "model": model}
+        # Leased so pool eviction cannot close the client mid-stream
+        with self.registry.lease(provider_id, api_key, model) as provider:
+            async with self.scheduler.slot(provider_id, api_key, user_id, prompt_tokens) as permit:
+                stream = provider.stream(messages)
+                output_tokens = 0
+                outcome = "cancelled"
+                started = time.perf_counter()
+                first_token_at = None
+                try:
+                    async for text in stream:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            UPSTREAM_FIRST_TOKEN.observe(first_token_at - started, **labels)
+                        output_tokens += estimate_tokens(text)
+                        yield text
+                    outcome = "ok"
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    permit.charge(output_tokens)
+                    await stream.aclose()
+                    ended = time.perf_counter()
+                    UPSTREAM_DURATION.observe(ended - started, kind="stream", **labels)
+                    UPSTREAM_CALLS.inc(kind="stream", outcome=outcome, **labels)
+                    UPSTREAM_TOKENS.inc(prompt_tokens, direction="prompt", **labels)
+                    UPSTREAM_TOKENS.inc(output_tokens, direction="output", **labels)
+                    if outcome == "ok" and first_token_at is not None and ended > first_token_at:
+                        UPSTREAM_TOKEN_RATE.observe(output_tokens / (ended - first_token_at), **labels)
+    
+    async def _scheduled_generate(
+        self,
+        provider_id: str,
+        model: str,
+        api_key: str,
+        user_id: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """Generate with the pooled provider once the scheduler grants an upstream slot"""
+        prompt_tokens = sum(map(message_tokens, messages))
+        labels = {"provider": provider_id, "model": model}
+        with self.registry.lease(provider_id, api_key, model) as provider:
+            async with self.scheduler.slot(provider_id, api_key, user_id, prompt_tokens) as permit:
+                outcome = "cancelled"
+                started = time.perf_counter()
+                try:
+                    text = await provider.generate_response(messages)
+                    outcome = "ok"
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    UPSTREAM_DURATION.observe(time.perf_counter() - started, kind="generate", **labels)
+                    UPSTREAM_CALLS.inc(kind="generate", outcome=outcome, **labels)
+                output_tokens = estimate_tokens(text)
+                permit.charge(output_tokens)
+                UPSTREAM_TOKENS.inc(prompt_tokens, direction="prompt", **labels)
+                UPSTREAM_TOKENS.inc(output_tokens, direction="output", **labels)
+                return text
+    
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        provider_id: str,
+        api_key: str,
+        model: str,
+        conversation_id: Optional[Any] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream response text using the specified provider
+        
+        Chunks come from the provider's upstream iterator, read at most
+        SINGLE_FLIGHT_BUFFER_BYTES ahead of the slowest reader (exactly at
+        the reader's pace with SINGLE_FLIGHT=0), so a slow reader slows the
+        upstream read down with it. Identical concurrent requests (same
+        provider, model, key and messages) subscribe to one upstream stream
+        instead of starting their own. Upstream calls wait
+        their turn in the scheduler, which applies the provider's and key's
+        concurrency and rate limits fairly across users. Transient failures
+        are retried, and slow starts optionally hedged, until the first chunk
+        arrives; after that a failure ends the stream.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            provider_id: ID of the AI provider (e.g., 'gemini', 'openai')
+            api_key: API key for the provider
+            model: Model name to use
+            conversation_id: Stored conversation the messages come from, if any
+            user_id: User the request is queued for; defaults to the API key
+            
+        Returns:
+            Async iterator of text chunks; raises if generation fails
+        """
+        messages = self._fit_context(
+            messages, provider_id, api_key, model, conversation_id, user_id
+        )
+        # Map database model_id to provider_id
+        provider_id = self._map_model_id_to_provider_id(provider_id)
+        
+        def start() -> AsyncIterator[str]:
+            return self.resilience.stream(
+                provider_id,
+                lambda: self._scheduled_stream(provider_id, model, api_key, user_id, messages),
+            )
+        
+        if not SINGLE_FLIGHT:
+            return start()
+        key = request_key(provider_id, model, messages, api_key)
+        return self.flights.stream(key, start)
+    
     async def stream_chat(
         self,
         messages: List[Dict[str, str]],
@@ -46,10 +281,9 @@ class AIService:
             on_chunk: Callback function for streaming chunks
         """
         try:
-            # Map database model_id to provider_id
-            provider_id = self._map_model_id_to_provider_id(provider_id)
-            provider = self.registry.get_provider(provider_id, api_key, model)
-            await provider.stream_chat(messages, on_chunk)
+            async for text in self.stream(messages, provider_id, api_key, model):
+                on_chunk({"content": text, "isComplete": False, "error": None})
+            on_chunk({"content": "", "isComplete": True, "error": None})
         except Exception as e:
             on_chunk({
                 "content": "",
@@ -62,7 +296,9 @@ class AIService:
         messages: List[Dict[str, str]],
         provider_id: str,
         api_key: str,
-        model: str
+        model: str,
+        conversation_id: Optional[Any] = None,
+        user_id: Optional[str] = None
     ) -> str:
         """
         Generate a complete response using the specified provider
@@ -72,16 +308,31 @@ class AIService:
             provider_id: ID of the AI provider
             api_key: API key for the provider
             model: Model name to use
+            conversation_id: Stored conversation the messages come from, if any
+            user_id: User the request is queued for; defaults to the API key
             
         Returns:
             Complete response text
         """
-        print("Model information")
-        print(provider_id, api_key, model)
+        messages = self._fit_context(
+            messages, provider_id, api_key, model, conversation_id, user_id
+        )
         # Map database model_id to provider_id  
         actual_provider_id = self._map_model_id_to_provider_id(provider_id)
-        provider = self.registry.get_provider(actual_provider_id, api_key, model)
-        return await provider.generate_response(messages)
+        
+        def start() -> Awaitable[str]:
+            return self.resilience.call(
+                actual_provider_id,
+                lambda: self._scheduled_generate(
+                    actual_provider_id, model, api_key, user_id, messages
+                ),
+            )
+        
+        if not SINGLE_FLIGHT:
+            return await start()
+        # Duplicates arriving while this runs wait for the same result
+        key = request_key(actual_provider_id, model, messages, api_key)
+        return await self.flights.call(key, start)
     
     def get_available_providers(self) -> List[str]:
         """Get list of available provider IDs"""
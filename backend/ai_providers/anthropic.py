@@ -0,0 +1,95 @@
+import os
+from typing import Any, AsyncIterator, Dict, List
+import httpx
+from .base import AIProvider, ProviderRegistry
+from .errors import ProviderError, ProviderUnavailable, RateLimited
+from .http_client import event_json, get_http_client, status_error, transport_error
+from .sse import SSEDecoder
+
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com/v1")
+ANTHROPIC_VERSION = "2023-06-01"
+# The messages API requires an output limit on every request
+ANTHROPIC_MAX_TOKENS = int(os.getenv("ANTHROPIC_MAX_TOKENS", "4096"))
+
+
+def _stream_error(error: Dict[str, Any]) -> ProviderError:
+    """Typed error for an `error` event sent mid-stream"""
+    message = f"Anthropic API error: {error.get('message') or error}"
+    if error.get("type") == "overloaded_error":
+        return ProviderUnavailable(message)
+    if error.get("type") == "rate_limit_error":
+        return RateLimited(message)
+    return ProviderError(message)
+
+
+@ProviderRegistry.register("claude")
+class AnthropicProvider(AIProvider):
+    """Anthropic messages API"""
+
+    name = "Anthropic"
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(api_key, model)
+        self.url = f"{ANTHROPIC_BASE_URL.rstrip('/')}/messages"
+        self.headers = {"x-api-key": api_key, "anthropic-version": ANTHROPIC_VERSION}
+
+    def _body(self, messages: List[Dict[str, str]], stream: bool) -> Dict[str, Any]:
+        # System prompts go in their own field rather than the turn list
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        body = {
+            "model": self.model,
+            "max_tokens": ANTHROPIC_MAX_TOKENS,
+            "messages": [
+                {"role": m["role"], "content": m["content"]}
+                for m in messages
+                if m["role"] != "system"
+            ],
+            "stream": stream,
+        }
+        if system:
+            body["system"] = system
+        return body
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream text deltas over the shared connection pool"""
+        client = get_http_client()
+        try:
+            async with client.stream(
+                "POST", self.url, headers=self.headers, json=self._body(messages, True)
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    raise status_error(self.name, response)
+
+                decoder = SSEDecoder()
+                async for data in response.aiter_bytes():
+                    for event in decoder.feed(data):
+                        if event.event == "message_stop":
+                            return
+                        if event.event == "error":
+                            raise _stream_error(event_json(self.name, event.data).get("error", {}))
+                        if event.event != "content_block_delta":
+                            continue
+                        delta = event_json(self.name, event.data).get("delta") or {}
+                        if delta.get("text"):
+                            yield delta["text"]
+        except httpx.HTTPError as e:
+            raise transport_error(self.name, e) from e
+
+    async def generate_response(self, messages: List[Dict[str, str]]) -> str:
+        """Generate a complete message"""
+        client = get_http_client()
+        try:
+            response = await client.post(
+                self.url, headers=self.headers, json=self._body(messages, False)
+            )
+        except httpx.HTTPError as e:
+            raise transport_error(self.name, e) from e
+        if response.is_error:
+            raise status_error(self.name, response)
+
+        return "".join(
+            block.get("text", "")
+            for block in response.json().get("content") or ()
+            if block.get("type") == "text"
+        )
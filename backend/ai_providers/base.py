@@ -1,15 +1,75 @@
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import os
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Callable, List
+from collections import OrderedDict
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Set, Tuple
+from .buffer import StreamBuffer
+
+# Installed packages can offer providers under this entry point group,
+# each as `provider_id = "package.module:ClassName"`
+PROVIDER_ENTRY_POINTS = "stepper_ai.providers"
 
 
 class AIProvider(ABC):
-    """Abstract base class for AI providers"""
+    """
+    Abstract base class for AI providers
+    
+    Providers implement streaming by overriding either `stream` (preferred:
+    an async iterator straight over the upstream response) or the older
+    callback-based `stream_chat`. Each has a default built on the other.
+    """
     
     def __init__(self, api_key: str, model: str):
         self.api_key = api_key
         self.model = model
     
-    @abstractmethod
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream response text chunk by chunk
+        
+        The default adapts a callback-based `stream_chat`.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            
+        Yields:
+            Text chunks as they arrive; raises if generation fails
+        """
+        if type(self).stream_chat is AIProvider.stream_chat:
+            raise NotImplementedError(
+                f"{type(self).__name__} must implement stream or stream_chat"
+            )
+        
+        # Callbacks cannot wait, so a slow consumer gets coalesced chunks
+        # rather than an ever longer queue
+        buffer = StreamBuffer(policy="coalesce")
+        
+        def on_chunk(chunk: Dict[str, Any]) -> None:
+            if chunk.get("error"):
+                buffer.close(RuntimeError(chunk["error"]))
+            elif chunk["isComplete"]:
+                buffer.close()
+            else:
+                buffer.put_nowait(chunk["content"])
+        
+        def on_done(task: asyncio.Task) -> None:
+            error = None if task.cancelled() else task.exception()
+            buffer.close(error)
+        
+        task = asyncio.create_task(self.stream_chat(messages, on_chunk))
+        task.add_done_callback(on_done)
+        try:
+            async for text in buffer:
+                yield text
+        finally:
+            if not task.done():
+                task.cancel()
+            buffer.discard()
+    
     async def stream_chat(
         self, 
         messages: List[Dict[str, str]], 
@@ -18,12 +78,19 @@ class AIProvider(ABC):
         """
         Stream chat responses chunk by chunk
         
+        The default drives `stream`.
+        
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             on_chunk: Callback function that receives chunks in format:
                      {"content": str, "isComplete": bool, "error": str | None}
         """
-        pass
+        try:
+            async for text in self.stream(messages):
+                on_chunk({"content": text, "isComplete": False, "error": None})
+            on_chunk({"content": "", "isComplete": True, "error": None})
+        except Exception as e:
+            on_chunk({"content": "", "isComplete": True, "error": str(e)})
     
     @abstractmethod
     async def generate_response(self, messages: List[Dict[str, str]]) -> str:
@@ -37,12 +104,38 @@ class AIProvider(ABC):
             Complete response text
         """
         pass
+    
+    async def aclose(self) -> None:
+        """Release upstream connections held by this instance"""
+        pass
 
 
 class ProviderRegistry:
-    """Registry for managing AI providers"""
+    """
+    Registry for managing AI providers
+    
+    Instances are pooled per (provider, model, API key) so upstream clients
+    and their TLS connections stay warm across messages. The pool evicts the
+    least recently used instance once full, and instances left idle longer
+    than `pool_idle_ttl` seconds. Instances taken with `lease` are only
+    closed once the last lease on them ends, so eviction never closes a
+    client under a request that is still using it.
+    
+    Providers registered by module path are imported on first use, so a
+    cold start does not load SDKs for providers no request has asked for.
+    """
     
     _providers: Dict[str, type] = {}
+    # provider_id -> "module:ClassName", imported on first use
+    _lazy: Dict[str, str] = {}
+    _entry_points_loaded: bool = False
+    _pool: "OrderedDict[Tuple[str, str, str], Tuple[AIProvider, float]]" = OrderedDict()
+    pool_size: int = int(os.getenv("PROVIDER_POOL_SIZE", "256"))
+    pool_idle_ttl: float = float(os.getenv("PROVIDER_POOL_IDLE_TTL", "600"))
+    # Active leases per instance, pooled or already evicted
+    _leases: Dict[AIProvider, int] = {}
+    # Evicted instances waiting for their last lease to end
+    _evicted: Set[AIProvider] = set()
     
     @classmethod
     def register(cls, provider_id: str):
@@ -53,14 +146,114 @@ class ProviderRegistry:
         return decorator
     
     @classmethod
-    def get_provider(cls, provider_id: str, api_key: str, model: str) -> AIProvider:
-        """Get an instance of the specified provider"""
+    def register_lazy(cls, provider_id: str, path: str) -> None:
+        """
+        Register a provider by "module:ClassName" without importing it
+        
+        A module path starting with "." is relative to this package.
+        """
         if provider_id not in cls._providers:
+            cls._lazy[provider_id] = path
+    
+    @classmethod
+    def _load_entry_points(cls) -> None:
+        if cls._entry_points_loaded:
+            return
+        cls._entry_points_loaded = True
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group=PROVIDER_ENTRY_POINTS):
+            cls._lazy.setdefault(entry_point.name, entry_point.value)
+    
+    @classmethod
+    def _provider_class(cls, provider_id: str) -> type:
+        provider_class = cls._providers.get(provider_id)
+        if provider_class is not None:
+            return provider_class
+        
+        if provider_id not in cls._lazy:
+            cls._load_entry_points()
+        path = cls._lazy.get(provider_id)
+        if path is None:
             raise ValueError(f"Provider '{provider_id}' not found")
         
-        return cls._providers[provider_id](api_key, model)
+        module_name, _, class_name = path.partition(":")
+        module = importlib.import_module(module_name, __package__)
+        provider_class = getattr(module, class_name)
+        cls._providers[provider_id] = provider_class
+        return provider_class
+    
+    @classmethod
+    def get_provider(cls, provider_id: str, api_key: str, model: str) -> AIProvider:
+        """Get a pooled instance of the specified provider"""
+        provider_class = cls._provider_class(provider_id)
+        
+        now = time.monotonic()
+        cls._evict_idle(now)
+        
+        key = (provider_id, model, hashlib.sha256(api_key.encode()).hexdigest())
+        entry = cls._pool.get(key)
+        if entry is not None:
+            provider = entry[0]
+            cls._pool[key] = (provider, now)
+            cls._pool.move_to_end(key)
+            return provider
+        
+        provider = provider_class(api_key, model)
+        cls._pool[key] = (provider, now)
+        while len(cls._pool) > cls.pool_size:
+            _, (evicted, _) = cls._pool.popitem(last=False)
+            cls._close(evicted)
+        return provider
+    
+    @classmethod
+    def _evict_idle(cls, now: float) -> None:
+        # Least recently used entries sit at the front
+        while cls._pool:
+            key, (provider, last_used) = next(iter(cls._pool.items()))
+            if now - last_used < cls.pool_idle_ttl:
+                break
+            del cls._pool[key]
+            cls._close(provider)
+    
+    @classmethod
+    @contextlib.contextmanager
+    def lease(cls, provider_id: str, api_key: str, model: str) -> Iterator[AIProvider]:
+        """A pooled instance that stays open until the block exits"""
+        provider = cls.get_provider(provider_id, api_key, model)
+        cls._leases[provider] = cls._leases.get(provider, 0) + 1
+        try:
+            yield provider
+        finally:
+            cls._leases[provider] -= 1
+            if not cls._leases[provider]:
+                del cls._leases[provider]
+                if provider in cls._evicted:
+                    cls._evicted.discard(provider)
+                    cls._close(provider)
+    
+    @classmethod
+    def _close(cls, provider: AIProvider) -> None:
+        if provider in cls._leases:
+            # Closed when the last lease ends
+            cls._evicted.add(provider)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(provider.aclose())
+    
+    @classmethod
+    async def clear_pool(cls) -> None:
+        """Close and drop every pooled provider instance"""
+        providers = [provider for provider, _ in cls._pool.values()]
+        providers.extend(cls._evicted)
+        cls._pool.clear()
+        cls._evicted.clear()
+        await asyncio.gather(*(p.aclose() for p in providers), return_exceptions=True)
     
     @classmethod
     def get_available_providers(cls) -> List[str]:
-        """Get list of available provider IDs"""
-        return list(cls._providers.keys())
+        """Get list of available provider IDs, imported or not"""
+        cls._load_entry_points()
+        return list(dict.fromkeys([*cls._lazy, *cls._providers]))
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import deque
+from typing import Callable, Deque, Optional
+
+
+class MemoryBudget:
+    """
+    Global cap on text buffered across all active streams.
+
+    Sizes are counted in characters, which is bytes for the mostly ASCII
+    text models return. A stream with nothing buffered may always reserve,
+    so every stream keeps making progress however full the budget is.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self._released = asyncio.Event()
+
+    def reserve_nowait(self, size: int) -> None:
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+    async def reserve(self, size: int, held: Callable[[], int]) -> None:
+        """Wait until `size` more fits; `held()` is what the caller still buffers"""
+        if held() and self.used + size > self.limit:
+            self.waits += 1
+            while held() and self.used + size > self.limit:
+                self._released.clear()
+                await self._released.wait()
+        self.reserve_nowait(size)
+
+    def release(self, size: int) -> None:
+        if size:
+            self.used -= size
+            self._released.set()
+
+
+memory_budget = MemoryBudget(int(os.getenv("STREAM_MEMORY_BUDGET", str(64 * 1024 * 1024))))
+
+
+class StreamBuffer:
+    """
+    Bounded FIFO of text chunks between one producer and one consumer.
+
+    Once `max_chunks` chunks are pending the overflow policy applies:
+    "block" makes the producer wait for the consumer, "coalesce" appends
+    the new text to the newest pending chunk instead. With either policy
+    the producer also waits while `max_bytes` are pending or the global
+    memory budget is spent. `put_nowait` is for sync callbacks that cannot
+    wait; it always coalesces and only accounts for the memory.
+    """
+
+    POLICIES = ("block", "coalesce")
+
+    def __init__(
+        self,
+        max_chunks: int = 64,
+        max_bytes: int = 256 * 1024,
+        policy: str = "block",
+        budget: MemoryBudget = memory_budget
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown stream overflow policy '{policy}'")
+        self.max_chunks = max(1, max_chunks)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.budget = budget
+        self.size = 0
+        self.blocked = 0
+        self.coalesced = 0
+        self._chunks: Deque[str] = deque()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+
+    def _full(self) -> bool:
+        if self.size >= self.max_bytes:
+            return True
+        return self.policy == "block" and len(self._chunks) >= self.max_chunks
+
+    def _append(self, text: str) -> None:
+        if self._chunks and len(self._chunks) >= self.max_chunks:
+            self._chunks[-1] += text
+            self.coalesced += 1
+        else:
+            self._chunks.append(text)
+        self.size += len(text)
+        self._readable.set()
+
+    async def put(self, text: str) -> None:
+        """Add a chunk, waiting for room as the overflow policy requires"""
+        if self._full():
+            self.blocked += 1
+            while self._full() and not self._closed:
+                self._writable.clear()
+                await self._writable.wait()
+        if self._closed:
+            return
+        await self.budget.reserve(len(text), lambda: self.size)
+        self._append(text)
+
+    def put_nowait(self, text: str) -> None:
+        """Add a chunk without waiting, coalescing once the buffer is full"""
+        if self._closed:
+            return
+        self.budget.reserve_nowait(len(text))
+        self._append(text)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Mark the end of the stream, optionally with the error that ended it"""
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        self._readable.set()
+        self._writable.set()
+
+    async def get(self) -> Optional[str]:
+        """
+        Next pending chunk, or None once the stream has ended and drained.
+
+        Raises the producer's error after the chunks before it were consumed.
+        """
+        while not self._chunks and not self._closed:
+            self._readable.clear()
+            await self._readable.wait()
+        if not self._chunks:
+            if self._error is not None:
+                raise self._error
+            return None
+
+        text = self._chunks.popleft()
+        self.size -= len(text)
+        self.budget.release(len(text))
+        self._writable.set()
+        return text
+
+    def discard(self) -> None:
+        """Drop anything still pending and give its memory back"""
+        self._chunks.clear()
+        self.budget.release(self.size)
+        self.size = 0
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        text = await self.get()
+        if text is None:
+            raise StopAsyncIteration
+        return text
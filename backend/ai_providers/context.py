@@ -0,0 +1,145 @@
+import os
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+from cache import TTLCache
+
+# Context window sizes in tokens, matched by model name prefix
+MODEL_CONTEXT_TOKENS = {
+    "gemini-1.0": 30_720,
+    "gemini-pro": 30_720,
+    "gemini-1.5": 1_048_576,
+    "gemini-2": 1_048_576,
+    "gpt-3.5": 16_385,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4": 8_192,
+    "claude": 200_000,
+}
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_DEFAULT_TOKENS", "32768"))
+# Optional cap below the model's window, to bound cost and latency
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+# Room left for the model's reply
+CONTEXT_RESPONSE_TOKENS = int(os.getenv("CONTEXT_RESPONSE_TOKENS", "4096"))
+
+# Role markers and separators each message adds on top of its text
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Running token totals of stored conversation history, keyed by conversation
+_token_prefixes = TTLCache(
+    maxsize=int(os.getenv("CONVERSATION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "900")),
+)
+# (messages covered, summary text) per conversation
+_summaries = TTLCache(
+    maxsize=int(os.getenv("CONVERSATION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "900")),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count: about four characters per token for English
+    text with the BPE vocabularies these providers use. Exact counts would
+    need each provider's tokenizer; the budget only needs the scale.
+    """
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message["content"])
+
+
+def context_budget(model: str) -> int:
+    """Tokens the prompt may use for `model`, leaving room for the reply"""
+    name = (model or "").lower().split("/")[-1]
+    window = DEFAULT_CONTEXT_TOKENS
+    for prefix in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if name.startswith(prefix):
+            window = MODEL_CONTEXT_TOKENS[prefix]
+            break
+    if CONTEXT_MAX_TOKENS > 0:
+        window = min(window, CONTEXT_MAX_TOKENS)
+    return max(1, window - CONTEXT_RESPONSE_TOKENS)
+
+
+def _token_prefix(messages: List[Dict[str, str]], conversation_id: Optional[str]) -> List[int]:
+    """
+    prefix[i] is the token estimate of messages[:i].
+
+    For stored conversations everything before the newest message is
+    history that never changes, so its totals are cached and each turn only
+    counts the messages added since.
+    """
+    if conversation_id is None:
+        return [0, *accumulate(map(message_tokens, messages))]
+
+    history = len(messages) - 1
+    prefix = _token_prefixes.get(conversation_id)
+    if prefix is None or len(prefix) > history + 1:
+        prefix = [0]
+    for message in messages[len(prefix) - 1 : history]:
+        prefix.append(prefix[-1] + message_tokens(message))
+    _token_prefixes.set(conversation_id, prefix)
+    return prefix + [prefix[-1] + message_tokens(messages[-1])]
+
+
+def cached_summary(conversation_id: Optional[str]) -> Optional[Tuple[int, str]]:
+    if conversation_id is None:
+        return None
+    return _summaries.get(conversation_id)
+
+
+def store_summary(conversation_id: str, covered: int, text: str) -> None:
+    current = _summaries.get(conversation_id)
+    if current is None or current[0] < covered:
+        _summaries.set(conversation_id, (covered, text))
+
+
+def fit_context(
+    messages: List[Dict[str, str]],
+    budget: int,
+    conversation_id: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], int, int]:
+    """
+    Drop the oldest turns until `messages` fits in `budget` tokens.
+
+    Leading system messages and the newest message are always kept, and
+    the kept turns start at a user message. If a rolling summary of the
+    conversation is cached it stands in for the dropped turns.
+
+    Returns:
+        (messages to send, number of pinned system messages, index of the
+        first kept turn); the turns between the two were dropped
+    """
+    if len(messages) < 2:
+        return messages, 0, 0
+
+    prefix = _token_prefix(messages, conversation_id)
+    total = prefix[-1]
+    if total <= budget:
+        return messages, 0, 0
+
+    pinned = 0
+    while pinned < len(messages) - 1 and messages[pinned]["role"] == "system":
+        pinned += 1
+
+    def first_kept(extra: int) -> int:
+        # Smallest start whose suffix plus the pinned prefix fits
+        need = total + prefix[pinned] + extra - budget
+        start = bisect_left(prefix, need, pinned, len(messages) - 1)
+        while start < len(messages) - 1 and messages[start]["role"] != "user":
+            start += 1
+        return start
+
+    start = first_kept(0)
+    summary = cached_summary(conversation_id)
+    if summary is None or summary[0] <= pinned:
+        return messages[:pinned] + messages[start:], pinned, start
+
+    summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary[1]}
+    start = first_kept(message_tokens(summary_message))
+    return messages[:pinned] + [summary_message] + messages[start:], pinned, start
@@ -0,0 +1,50 @@
+from typing import Optional
+
+
+class ProviderError(Exception):
+    """
+    An upstream provider call failed
+
+    `retryable` marks transient failures worth another attempt, and
+    `status_code` is what the API reports to its own clients.
+    """
+
+    retryable = False
+    status_code = 502
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderTimeout(ProviderError):
+    """The provider did not answer within the deadline"""
+
+    retryable = True
+    status_code = 504
+
+
+class ProviderUnavailable(ProviderError):
+    """Server-side or network failure at the provider"""
+
+    retryable = True
+    status_code = 503
+
+
+class RateLimited(ProviderError):
+    """The provider rejected the call for quota or rate limits"""
+
+    retryable = True
+    status_code = 429
+
+
+class AuthenticationFailed(ProviderError):
+    """The provider rejected the configured API key"""
+
+    status_code = 400
+
+
+class InvalidRequest(ProviderError):
+    """The provider rejected the request itself (model name, content, size)"""
+
+    status_code = 400
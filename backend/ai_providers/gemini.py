@@ -1,7 +1,42 @@
-import asyncio
-import google.generativeai as genai
-from typing import Dict, Any, Callable, List
+import google.ai.generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from google.api_core.client_options import ClientOptions
+from typing import Dict, AsyncIterator, List
 from .base import AIProvider, ProviderRegistry
+from .errors import (
+    AuthenticationFailed,
+    InvalidRequest,
+    ProviderError,
+    ProviderTimeout,
+    ProviderUnavailable,
+    RateLimited,
+)
+
+
+def _provider_error(error: Exception) -> ProviderError:
+    """Typed error for a google.api_core failure"""
+    message = f"Gemini API error: {str(error)}"
+    if isinstance(error, google_exceptions.TooManyRequests):
+        return RateLimited(message)
+    if isinstance(error, (google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)):
+        return ProviderTimeout(message)
+    if isinstance(error, (google_exceptions.ServerError, google_exceptions.RetryError)):
+        return ProviderUnavailable(message)
+    if isinstance(error, (google_exceptions.Unauthorized, google_exceptions.Forbidden)):
+        return AuthenticationFailed(message)
+    # An invalid key is reported as a plain 400
+    if isinstance(error, google_exceptions.BadRequest) and "API key" in str(error):
+        return AuthenticationFailed(message)
+    if isinstance(error, google_exceptions.ClientError):
+        return InvalidRequest(message)
+    return ProviderError(message)
+
+
+def _response_text(response: glm.GenerateContentResponse) -> str:
+    """Text of the first candidate; empty when it has none, e.g. when blocked"""
+    if not response.candidates:
+        return ""
+    return "".join(part.text for part in response.candidates[0].content.parts)
 
 
 @ProviderRegistry.register("gemini")
@@ -10,8 +45,22 @@ class GeminiProvider(AIProvider):
     
     def __init__(self, api_key: str, model: str):
         super().__init__(api_key, model)
-        genai.configure(api_key=api_key)
-        self.client = genai.GenerativeModel(model)
+        # A client bound to this key; the SDK's global configure() would swap the key
+        # process-wide under any other user's in-flight request
+        self.client = glm.GenerativeServiceAsyncClient(
+            client_options=ClientOptions(api_key=api_key)
+        )
+        self.model_name = model if "/" in model else f"models/{model}"
+    
+    async def aclose(self) -> None:
+        """Close the gRPC channel behind this key's client"""
+        await self.client.transport.close()
+    
+    def _request(self, messages: List[Dict[str, str]]) -> glm.GenerateContentRequest:
+        return glm.GenerateContentRequest(
+            model=self.model_name,
+            contents=self._convert_messages_to_gemini_format(messages),
+        )
     
     def _convert_messages_to_gemini_format(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """Convert standard chat format to Gemini format"""
@@ -36,66 +85,33 @@ class GeminiProvider(AIProvider):
         
         return gemini_messages
     
-    async def stream_chat(
-        self, 
-        messages: List[Dict[str, str]], 
-        on_chunk: Callable[[Dict[str, Any]], None]
-    ) -> None:
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
         """Stream chat responses from Gemini"""
+        call = None
         try:
-            # Convert messages to Gemini format
-            gemini_messages = self._convert_messages_to_gemini_format(messages)
-            
-            # Create chat session
-            chat = self.client.start_chat(history=gemini_messages[:-1])
-            
-            # Get the last message (current user input)
-            last_message = gemini_messages[-1]["parts"][0]["text"]
-            
-            # Generate streaming response
-            response = await chat.send_message_async(
-                last_message,
-                stream=True
-            )
-            
-            async for chunk in response:
-                if chunk.text:
-                    on_chunk({
-                        "content": chunk.text,
-                        "isComplete": False,
-                        "error": None
-                    })
-            
-            # Signal completion
-            on_chunk({
-                "content": "",
-                "isComplete": True,
-                "error": None
-            })
-            
-        except Exception as e:
-            on_chunk({
-                "content": "",
-                "isComplete": True,
-                "error": str(e)
-            })
+            call = await self.client.stream_generate_content(self._request(messages))
+            async for chunk in call:
+                text = _response_text(chunk)
+                if text:
+                    yield text
+        except google_exceptions.GoogleAPIError as e:
+            raise _provider_error(e) from e
+        finally:
+            # Release the upstream stream if the consumer stopped early
+            if call is not None:
+                call.cancel()
     
     async def generate_response(self, messages: List[Dict[str, str]]) -> str:
         """Generate a complete response from Gemini"""
         try:
-            # Convert messages to Gemini format
-            gemini_messages = self._convert_messages_to_gemini_format(messages)
-            
-            # Create chat session
-            chat = self.client.start_chat(history=gemini_messages[:-1])
-            
-            # Get the last message (current user input)
-            last_message = gemini_messages[-1]["parts"][0]["text"]
-            
-            # Generate response
-            response = await chat.send_message_async(last_message)
-            
-            return response.text
-            
+            response = await self.client.generate_content(self._request(messages))
+        except google_exceptions.GoogleAPIError as e:
+            raise _provider_error(e) from e
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            raise ProviderError(f"Gemini API error: {str(e)}") from e
+        
+        if not response.candidates:
+            raise InvalidRequest(
+                f"Gemini API error: no response ({response.prompt_feedback.block_reason.name})"
+            )
+        return _response_text(response)
@@ -0,0 +1,102 @@
+import importlib.util
+import os
+from typing import Optional
+import httpx
+from .errors import (
+    AuthenticationFailed,
+    InvalidRequest,
+    ProviderError,
+    ProviderTimeout,
+    ProviderUnavailable,
+    RateLimited,
+)
+from .sse import loads
+
+# One connection pool for every HTTP provider, user and API key
+HTTP_MAX_CONNECTIONS = int(os.getenv("PROVIDER_HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("PROVIDER_HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_HTTP_CONNECT_TIMEOUT", "10"))
+# Per read; the resilience layer bounds the call as a whole
+HTTP_READ_TIMEOUT = float(os.getenv("PROVIDER_HTTP_READ_TIMEOUT", "120"))
+# HTTP/2 multiplexes concurrent streams to a provider over one connection;
+# it needs the `h2` package (httpx[http2])
+HTTP2 = os.getenv("PROVIDER_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The process-wide client, created on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its pooled connections"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # HTTP-date form; fall back to our own backoff
+        return None
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        body = response.json()
+    except (ValueError, UnicodeDecodeError):
+        return response.text[:200]
+    error = body.get("error") if isinstance(body, dict) else None
+    if isinstance(error, dict):
+        return str(error.get("message") or error)
+    return str(error or body)[:200]
+
+
+def status_error(name: str, response: httpx.Response) -> ProviderError:
+    """Typed error for an unsuccessful response whose body has been read"""
+    status = response.status_code
+    message = f"{name} API error {status}: {_error_detail(response)}"
+    if status == 429:
+        return RateLimited(message, retry_after=_retry_after(response))
+    if status in (401, 403):
+        return AuthenticationFailed(message)
+    if status in (408, 504):
+        return ProviderTimeout(message)
+    if status >= 500:
+        return ProviderUnavailable(message, retry_after=_retry_after(response))
+    return InvalidRequest(message)
+
+
+def transport_error(name: str, error: httpx.HTTPError) -> ProviderError:
+    """Typed error for a request that got no usable response"""
+    if isinstance(error, httpx.TimeoutException):
+        return ProviderTimeout(f"{name} API timed out: {type(error).__name__}")
+    if isinstance(error, httpx.TransportError):
+        return ProviderUnavailable(f"{name} API unreachable: {str(error) or type(error).__name__}")
+    return ProviderError(f"{name} API error: {str(error)}")
+
+
+def event_json(name: str, data: bytes) -> dict:
+    """Decode one `data:` payload of a provider's event stream"""
+    try:
+        return loads(data)
+    except ValueError:
+        raise ProviderError(f"{name} API sent malformed event: {data[:200]!r}") from None
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import random
+from typing import AsyncIterator, Dict, List
+from .base import AIProvider, ProviderRegistry
+from .errors import ProviderUnavailable
+
+# Defaults; a model name like "tokens=200,delay_ms=5,error_rate=0.01"
+# overrides them per configured model
+MOCK_DEFAULTS = {
+    # Chunks per response, and the delay before the first and between later ones
+    "tokens": float(os.getenv("MOCK_TOKENS", "50")),
+    "first_token_ms": float(os.getenv("MOCK_FIRST_TOKEN_MS", "0")),
+    "delay_ms": float(os.getenv("MOCK_TOKEN_DELAY_MS", "10")),
+    # Share of calls that fail with a retryable error, after `error_after` chunks
+    "error_rate": float(os.getenv("MOCK_ERROR_RATE", "0")),
+    "error_after": float(os.getenv("MOCK_ERROR_AFTER", "0")),
+    "seed": float(os.getenv("MOCK_SEED", "0")),
+}
+
+
+def _settings(model: str) -> Dict[str, float]:
+    settings = dict(MOCK_DEFAULTS)
+    for part in model.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() in settings and value:
+            settings[name.strip()] = float(value)
+    return settings
+
+
+@ProviderRegistry.register("mock")
+class MockProvider(AIProvider):
+    """
+    Canned responses at a configurable pace, for load tests and local runs.
+
+    Output depends only on the settings and the last message, and failures
+    follow a seeded random sequence per instance, so runs are repeatable.
+    """
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(api_key, model)
+        self.settings = _settings(model)
+        self._random = random.Random(self.settings["seed"])
+
+    def _fails(self) -> bool:
+        return self._random.random() < self.settings["error_rate"]
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Emit `tokens` chunks `delay_ms` apart"""
+        settings = self.settings
+        fails = self._fails()
+        words = (messages[-1]["content"].split() if messages else None) or ["token"]
+        await asyncio.sleep(settings["first_token_ms"] / 1000)
+        for i in range(int(settings["tokens"])):
+            if fails and i == int(settings["error_after"]):
+                raise ProviderUnavailable(f"Mock error after {i} chunks")
+            if i:
+                await asyncio.sleep(settings["delay_ms"] / 1000)
+            yield f"{words[i % len(words)]} "
+        if fails and settings["error_after"] >= settings["tokens"]:
+            raise ProviderUnavailable("Mock error at end of stream")
+
+    async def generate_response(self, messages: List[Dict[str, str]]) -> str:
+        """The concatenated stream"""
+        return "".join([text async for text in self.stream(messages)])
@@ -0,0 +1,84 @@
+import os
+from typing import Any, AsyncIterator, Dict, List
+import httpx
+from .base import AIProvider, ProviderRegistry
+from .errors import ProviderError
+from .http_client import event_json, get_http_client, status_error, transport_error
+from .sse import SSEDecoder
+
+# Point these at any server speaking the chat completions API (vLLM,
+# Ollama, LM Studio, a proxy) to route the provider there
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+
+
+@ProviderRegistry.register("openai")
+class OpenAICompatibleProvider(AIProvider):
+    """OpenAI chat completions API, or any server compatible with it"""
+
+    name = "OpenAI"
+    base_url = OPENAI_BASE_URL
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(api_key, model)
+        self.url = f"{self.base_url.rstrip('/')}/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    def _body(self, messages: List[Dict[str, str]], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": message["role"], "content": message["content"]}
+                for message in messages
+            ],
+            "stream": stream,
+        }
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Stream chat completion deltas over the shared connection pool"""
+        client = get_http_client()
+        try:
+            async with client.stream(
+                "POST", self.url, headers=self.headers, json=self._body(messages, True)
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    raise status_error(self.name, response)
+
+                decoder = SSEDecoder()
+                async for data in response.aiter_bytes():
+                    for event in decoder.feed(data):
+                        if event.data == b"[DONE]":
+                            return
+                        payload = event_json(self.name, event.data)
+                        if "error" in payload:
+                            raise ProviderError(f"{self.name} API error: {payload['error']}")
+                        for choice in payload.get("choices") or ():
+                            content = (choice.get("delta") or {}).get("content")
+                            if content:
+                                yield content
+        except httpx.HTTPError as e:
+            raise transport_error(self.name, e) from e
+
+    async def generate_response(self, messages: List[Dict[str, str]]) -> str:
+        """Generate a complete chat completion"""
+        client = get_http_client()
+        try:
+            response = await client.post(
+                self.url, headers=self.headers, json=self._body(messages, False)
+            )
+        except httpx.HTTPError as e:
+            raise transport_error(self.name, e) from e
+        if response.is_error:
+            raise status_error(self.name, response)
+
+        choices = response.json().get("choices") or [{}]
+        return (choices[0].get("message") or {}).get("content") or ""
+
+
+@ProviderRegistry.register("groq")
+class GroqProvider(OpenAICompatibleProvider):
+    """Groq, through its OpenAI-compatible endpoint"""
+
+    name = "Groq"
+    base_url = GROQ_BASE_URL
@@ -1,5 +1,30 @@
+import importlib
+import os
 from .base import AIProvider, ProviderRegistry
-from .gemini import GeminiProvider
 
-# Import all providers to register them
-__all__ = ["AIProvider", "ProviderRegistry", "GeminiProvider",]
+# Registered by module path and imported on first use: the Gemini SDK
+# alone pulls in grpc and protobuf, which every cold start would pay for
+ProviderRegistry.register_lazy("gemini", ".gemini:GeminiProvider")
+ProviderRegistry.register_lazy("openai", ".openai_compatible:OpenAICompatibleProvider")
+ProviderRegistry.register_lazy("groq", ".openai_compatible:GroqProvider")
+ProviderRegistry.register_lazy("claude", ".anthropic:AnthropicProvider")
+
+# The mock provider is only offered when asked for, e.g. by load tests
+if os.getenv("MOCK_PROVIDER", "0") == "1":
+    ProviderRegistry.register_lazy("mock", ".mock:MockProvider")
+
+_MODULES = {
+    "GeminiProvider": ".gemini",
+    "OpenAICompatibleProvider": ".openai_compatible",
+    "GroqProvider": ".openai_compatible",
+    "AnthropicProvider": ".anthropic",
+}
+
+__all__ = ["AIProvider", "ProviderRegistry", *_MODULES]
+
+
+def __getattr__(name: str):
+    # `from .providers import GeminiProvider` still works, at import cost
+    if name in _MODULES:
+        return getattr(importlib.import_module(_MODULES[name], __package__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
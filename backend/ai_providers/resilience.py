@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from .errors import ProviderError, ProviderTimeout
+
+logger = logging.getLogger(__name__)
+
+# Extra attempts for transient failures, before any output was produced
+PROVIDER_RETRIES = int(os.getenv("PROVIDER_RETRIES", "2"))
+PROVIDER_RETRY_BASE = float(os.getenv("PROVIDER_RETRY_BASE", "0.5"))
+PROVIDER_RETRY_MAX = float(os.getenv("PROVIDER_RETRY_MAX", "8"))
+# Deadline for a whole call, or for a stream's first token, retries included
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "120"))
+# Longest wait for one attempt's first token, and between later tokens
+PROVIDER_FIRST_TOKEN_TIMEOUT = float(os.getenv("PROVIDER_FIRST_TOKEN_TIMEOUT", "30"))
+PROVIDER_IDLE_TIMEOUT = float(os.getenv("PROVIDER_IDLE_TIMEOUT", "60"))
+# Hedging: start a duplicate attempt once the first is slower than the
+# provider's recent p95 (PROVIDER_HEDGE_DELAY until enough samples exist)
+PROVIDER_HEDGE = os.getenv("PROVIDER_HEDGE", "0") == "1"
+PROVIDER_HEDGE_DELAY = float(os.getenv("PROVIDER_HEDGE_DELAY", "2"))
+HEDGE_MIN_SAMPLES = 20
+
+_Start = Callable[[], AsyncIterator[str]]
+
+
+def _close_opened_stream(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is None:
+        stream, _ = task.result()
+        asyncio.ensure_future(stream.aclose())
+
+
+class LatencyWindow:
+    """Recent latencies of one provider, for the hedging delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class Resilience:
+    """
+    Deadlines, retries and hedging around upstream calls.
+
+    Only ProviderErrors marked retryable are retried, with full-jitter
+    exponential backoff (or the provider's retry-after), and never once a
+    stream has produced output: a retry then would repeat text the client
+    already has. Anything else propagates unchanged.
+    """
+
+    def __init__(
+        self,
+        retries: int = PROVIDER_RETRIES,
+        deadline: float = PROVIDER_TIMEOUT,
+        first_token_timeout: float = PROVIDER_FIRST_TOKEN_TIMEOUT,
+        idle_timeout: float = PROVIDER_IDLE_TIMEOUT,
+        hedge: bool = PROVIDER_HEDGE
+    ):
+        self.retries = retries
+        self.deadline = deadline
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self.hedge = hedge
+        self._latency: Dict[str, LatencyWindow] = {}
+        self.attempts = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _window(self, provider_id: str) -> LatencyWindow:
+        window = self._latency.get(provider_id)
+        if window is None:
+            window = self._latency[provider_id] = LatencyWindow()
+        return window
+
+    def hedge_delay(self, provider_id: str) -> float:
+        p95 = self._window(provider_id).p95()
+        return PROVIDER_HEDGE_DELAY if p95 is None else p95
+
+    def _backoff(self, attempt: int, error: ProviderError) -> float:
+        if error.retry_after is not None:
+            return error.retry_after
+        return random.uniform(0, min(PROVIDER_RETRY_MAX, PROVIDER_RETRY_BASE * 2 ** attempt))
+
+    async def _with_retries(self, provider_id: str, attempt: Callable[[float], Awaitable]):
+        """Run `attempt(time_left)` until it succeeds, fails for good, or time runs out"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        for attempt_number in range(self.retries + 1):
+            try:
+                return await attempt(deadline - loop.time())
+            except ProviderError as e:
+                if not e.retryable or attempt_number == self.retries:
+                    raise
+                delay = self._backoff(attempt_number, e)
+                if loop.time() + delay >= deadline:
+                    raise
+                self.retried += 1
+                logger.warning(
+                    "Retrying %s in %.2fs: %s",
+                    provider_id,
+                    delay,
+                    e,
+                    extra={"provider": provider_id, "error_type": type(e).__name__},
+                )
+                await asyncio.sleep(delay)
+
+    async def _race(
+        self, provider_id: str, start: Callable[[], Awaitable]
+    ) -> Tuple[object, List[asyncio.Task]]:
+        """
+        Await `start()`, hedged with a second `start()` if it is slow.
+
+        Returns the first successful result and the other attempts' tasks,
+        for the caller to cancel and dispose of.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.attempts += 1
+        primary = asyncio.ensure_future(start())
+        if not self.hedge:
+            try:
+                result = await primary
+            finally:
+                primary.cancel()
+            self._window(provider_id).add(loop.time() - started)
+            return result, []
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(provider_id))
+            if not done:
+                self.hedged += 1
+                self.attempts += 1
+                pending.add(asyncio.ensure_future(start()))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        self._window(provider_id).add(loop.time() - started)
+                        losers = [other for other in done | pending if other is not task]
+                        pending = set()
+                        return task.result(), losers
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, provider_id: str, start: Callable[[], Awaitable[str]]) -> str:
+        """Result of `start()`, retried and hedged as configured"""
+
+        async def attempt(time_left: float) -> str:
+            try:
+                result, losers = await asyncio.wait_for(
+                    self._race(provider_id, start), min(time_left, self.deadline)
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise ProviderTimeout(f"{provider_id} did not answer in time") from None
+            for loser in losers:
+                loser.cancel()
+            return result
+
+        return await self._with_retries(provider_id, attempt)
+
+    async def _open(self, start: _Start) -> Tuple[AsyncIterator[str], Optional[str]]:
+        """Start a stream and wait for its first chunk (None if it is empty)"""
+        stream = start()
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    async def stream(self, provider_id: str, start: _Start) -> AsyncIterator[str]:
+        """Chunks of `start()`; retried and hedged up to the first chunk"""
+
+        async def attempt(time_left: float):
+            try:
+                (stream, first), losers = await asyncio.wait_for(
+                    self._race(provider_id, lambda: self._open(start)),
+                    min(time_left, self.first_token_timeout),
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise ProviderTimeout(f"{provider_id} sent nothing in time") from None
+            for loser in losers:
+                # A cancelled _open closes its own stream; one that already
+                # finished hands over an open stream to close
+                loser.cancel()
+                loser.add_done_callback(_close_opened_stream)
+            return stream, first
+
+        stream, first = await self._with_retries(provider_id, attempt)
+        try:
+            if first is None:
+                return
+            yield first
+            if self.idle_timeout <= 0:
+                async for text in stream:
+                    yield text
+                return
+            # One timer for the whole stream, armed only while waiting on the
+            # upstream: a wait_for per chunk would start a task per chunk
+            loop = asyncio.get_running_loop()
+            try:
+                async with asyncio.timeout(None) as idle:
+                    while True:
+                        idle.reschedule(loop.time() + self.idle_timeout)
+                        try:
+                            text = await stream.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        # A slow reader is not a stalled upstream
+                        idle.reschedule(None)
+                        yield text
+            except TimeoutError:
+                if not idle.expired():
+                    raise
+                self.timeouts += 1
+                raise ProviderTimeout(f"{provider_id} stalled mid-stream") from None
+        finally:
+            await stream.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
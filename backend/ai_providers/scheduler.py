@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+from .errors import RateLimited
+
+# Limits applied to every provider and API key; 0 means unlimited
+DEFAULT_LIMITS = {
+    # Concurrent upstream calls per API key, and per provider overall
+    "key_concurrency": int(os.getenv("SCHEDULER_KEY_CONCURRENCY", "8")),
+    "concurrency": int(os.getenv("SCHEDULER_PROVIDER_CONCURRENCY", "0")),
+    # Requests and (estimated) tokens per minute per API key
+    "rpm": int(os.getenv("SCHEDULER_KEY_RPM", "0")),
+    "tpm": int(os.getenv("SCHEDULER_KEY_TPM", "0")),
+}
+# Per-provider overrides as JSON, e.g. {"gemini": {"rpm": 15, "tpm": 1000000}}
+PROVIDER_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("SCHEDULER_LIMITS", "{}"))
+# Longest a request may wait for its turn before it is rejected
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "30"))
+
+
+class QueueTimeout(RateLimited):
+    """A request waited longer than SCHEDULER_MAX_WAIT for upstream capacity"""
+
+    # Our own queue is already full; another attempt would only queue again
+    retryable = False
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units a minute, in bursts of up to a minute's worth.
+
+    A request larger than the whole bucket is let through once the bucket
+    is full and leaves it in debt, so it cannot wait forever.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken; 0 if it can be taken now"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class _Limiter:
+    """Running calls and rate buckets of one API key, or of one provider"""
+
+    def __init__(self, concurrency: int, rpm: int = 0, tpm: int = 0):
+        self.concurrency = concurrency
+        self.running = 0
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.last_used = time.monotonic()
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """0 if a call may start now, inf while all slots are busy"""
+        if self.concurrency > 0 and self.running >= self.concurrency:
+            return float("inf")
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def start(self, tokens: int, now: float) -> None:
+        self.running += 1
+        self.last_used = now
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+
+class _Ticket:
+    def __init__(self, limiters: Tuple[_Limiter, _Limiter], tokens: int):
+        self.limiters = limiters
+        self.tokens = tokens
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class Permit:
+    """A granted upstream call; report generated text with `charge`"""
+
+    def __init__(self, ticket: _Ticket):
+        self._ticket = ticket
+
+    def charge(self, tokens: int) -> None:
+        """Bill output tokens, known only after the call, to the TPM bucket"""
+        for limiter in self._ticket.limiters:
+            if limiter.tokens is not None:
+                limiter.tokens.take(tokens)
+
+
+class Scheduler:
+    """
+    Shapes upstream calls to each provider's and API key's limits.
+
+    Requests wait in one FIFO per user, and users are served round-robin,
+    so a user with a burst of requests delays their own requests rather
+    than everyone's. A user whose next request is held by its key's limits
+    is skipped instead of blocking the users behind it.
+    """
+
+    def __init__(self, max_wait: float = SCHEDULER_MAX_WAIT):
+        self.max_wait = max_wait
+        self._providers: Dict[str, _Limiter] = {}
+        self._keys: Dict[Tuple[str, str], _Limiter] = {}
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _limits(self, provider_id: str) -> Dict[str, int]:
+        return {**DEFAULT_LIMITS, **PROVIDER_LIMITS.get(provider_id, {})}
+
+    def _limiters(self, provider_id: str, api_key: str) -> Tuple[_Limiter, _Limiter]:
+        limits = self._limits(provider_id)
+        provider = self._providers.get(provider_id)
+        if provider is None:
+            provider = self._providers[provider_id] = _Limiter(limits["concurrency"])
+
+        key = (provider_id, hashlib.sha256(api_key.encode()).hexdigest())
+        limiter = self._keys.get(key)
+        if limiter is None:
+            if len(self._keys) >= 10000:
+                self._forget_idle_keys()
+            limiter = self._keys[key] = _Limiter(
+                limits["key_concurrency"], limits["rpm"], limits["tpm"]
+            )
+        return provider, limiter
+
+    def _forget_idle_keys(self) -> None:
+        # A key idle for a minute has full buckets again, so nothing is lost
+        cutoff = time.monotonic() - 60
+        for key, limiter in list(self._keys.items()):
+            if limiter.running == 0 and limiter.last_used < cutoff:
+                del self._keys[key]
+
+    def _dispatch(self) -> None:
+        """Start every queued request the limits allow, users in turn"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        retry_in = float("inf")
+        progress = True
+        while progress and self._queues:
+            progress = False
+            for user in list(self._queues):
+                queue = self._queues[user]
+                ticket = queue[0]
+                wait = max(limiter.wait_time(ticket.tokens, now) for limiter in ticket.limiters)
+                if wait > 0:
+                    retry_in = min(retry_in, wait)
+                    continue
+
+                queue.popleft()
+                if queue:
+                    self._queues.move_to_end(user)
+                else:
+                    del self._queues[user]
+                for limiter in ticket.limiters:
+                    limiter.start(ticket.tokens, now)
+                ticket.granted.set_result(None)
+                progress = True
+
+        # Buckets refill on their own; busy slots wake us on release
+        if self._queues and retry_in != float("inf"):
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._dispatch)
+
+    def _release(self, ticket: _Ticket) -> None:
+        for limiter in ticket.limiters:
+            limiter.running -= 1
+        self._dispatch()
+
+    def _withdraw(self, user: str, ticket: _Ticket) -> None:
+        queue = self._queues.get(user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[user]
+
+    @asynccontextmanager
+    async def slot(
+        self, provider_id: str, api_key: str, user_id: Optional[str], tokens: int
+    ) -> AsyncIterator[Permit]:
+        """
+        Hold one upstream call's worth of the provider's and key's limits.
+
+        Raises:
+            QueueTimeout: No capacity freed up within `max_wait` seconds
+        """
+        ticket = _Ticket(self._limiters(provider_id, api_key), tokens)
+        user = user_id or f"key:{hashlib.sha256(api_key.encode()).hexdigest()}"
+        self._queues.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+
+        started = time.monotonic()
+        if not ticket.granted.done():
+            self.queued += 1
+            try:
+                # Not wait_for: it drops a cancellation that arrives just as
+                # the slot is granted, and the cancelled request would run
+                async with asyncio.timeout(self.max_wait or None):
+                    await asyncio.shield(ticket.granted)
+            except TimeoutError:
+                self._withdraw(user, ticket)
+                if not ticket.granted.done():
+                    self.rejected += 1
+                    raise QueueTimeout(
+                        f"No capacity for {provider_id} within {self.max_wait:.0f}s"
+                    ) from None
+            except BaseException:
+                self._withdraw(user, ticket)
+                if ticket.granted.done():
+                    self._release(ticket)
+                raise
+
+        waited = time.monotonic() - started
+        self.granted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        try:
+            yield Permit(ticket)
+        finally:
+            self._release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": sum(limiter.running for limiter in self._providers.values()),
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "granted": self.granted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "queue_wait_avg_s": self.wait_total / self.granted if self.granted else 0.0,
+            "queue_wait_max_s": self.wait_max,
+        }
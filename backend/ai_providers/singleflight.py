@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+from .buffer import MemoryBudget, memory_budget
+
+# Bytes a shared stream keeps for subscribers that have not read them yet;
+# late duplicates can join until the stream outgrows it
+SINGLE_FLIGHT_BUFFER_BYTES = int(os.getenv("SINGLE_FLIGHT_BUFFER_BYTES", str(64 * 1024)))
+
+
+def request_key(
+    provider_id: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    api_key: Optional[str] = None
+) -> str:
+    """
+    Hash of a generation request as the model sees it.
+
+    Role case, line endings and surrounding whitespace are normalized, so
+    requests that differ only in those share a key. Passing `api_key`
+    scopes the key to one set of credentials.
+    """
+    canonical = [
+        provider_id.strip().lower(),
+        model.strip(),
+        [
+            [
+                message["role"].strip().lower(),
+                message["content"].replace("\r\n", "\n").strip(),
+            ]
+            for message in messages
+        ],
+    ]
+    if api_key is not None:
+        canonical.append(hashlib.sha256(api_key.encode()).hexdigest())
+    payload = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Flight:
+    """
+    One upstream stream and the chunks its subscribers have yet to read.
+
+    Chunks are kept from the first one while their total stays under
+    `max_bytes`, so duplicates can still join and replay the stream from
+    the start. Past that the flight stops taking joiners, drops chunks
+    every subscriber has read, and the pump waits for the slowest
+    subscriber instead of reading further ahead. Kept chunks are reserved
+    from the stream memory budget.
+    """
+
+    def __init__(self, max_bytes: int, budget: MemoryBudget = memory_budget):
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.chunks: Deque[str] = deque()
+        # Position of chunks[0] in the stream
+        self.first = 0
+        self.size = 0
+        self.joinable = True
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # Position of the next chunk each subscriber reads
+        self.positions: Dict[object, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._advanced = asyncio.Event()
+
+    @property
+    def end(self) -> int:
+        return self.first + len(self.chunks)
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _trim(self) -> None:
+        """Drop chunks every subscriber has read, once joiners no longer need them"""
+        if self.joinable:
+            return
+        slowest = min(self.positions.values(), default=self.end)
+        while self.first < slowest:
+            size = len(self.chunks.popleft())
+            self.size -= size
+            self.budget.release(size)
+            self.first += 1
+
+    async def publish(self, text: str) -> None:
+        if self.size + len(text) > self.max_bytes and self.chunks:
+            self.joinable = False
+            self._trim()
+            while self.size + len(text) > self.max_bytes and self.chunks:
+                self._advanced.clear()
+                await self._advanced.wait()
+        await self.budget.reserve(len(text), lambda: self.size)
+        self.chunks.append(text)
+        self.size += len(text)
+        self._notify()
+
+    def advance(self, subscriber: object, position: int) -> None:
+        self.positions[subscriber] = position
+        self._trim()
+        self._advanced.set()
+
+    def leave(self, subscriber: object) -> None:
+        del self.positions[subscriber]
+        if self.positions:
+            self._trim()
+            self._advanced.set()
+        else:
+            self.budget.release(self.size)
+            self.chunks.clear()
+            self.size = 0
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Share one upstream generation between identical concurrent requests.
+
+    The first request for a key starts the generation; duplicates that
+    arrive while it runs attach to it. Stream subscribers all receive the
+    full chunk sequence: late joiners first replay what was already
+    produced, for as long as the stream fits in `max_bytes`; later
+    duplicates start their own. The upstream is read no faster than the
+    slowest subscriber, within that buffer. The upstream call is cancelled
+    once every caller has gone, and the key is released as soon as it
+    finishes, so nothing is cached.
+    """
+
+    def __init__(self, max_bytes: int = SINGLE_FLIGHT_BUFFER_BYTES):
+        self.max_bytes = max_bytes
+        self._streams: Dict[str, _Flight] = {}
+        self._calls: Dict[str, _Call] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def _pump(self, key: str, flight: _Flight, source: AsyncIterator[str]) -> None:
+        try:
+            async for text in source:
+                await flight.publish(text)
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+        finally:
+            await source.aclose()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    async def stream(
+        self, key: str, start: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Chunks of the in-flight stream for `key`, starting it with `start()` if needed"""
+        flight = self._streams.get(key)
+        if flight is None or not flight.joinable:
+            flight = self._streams[key] = _Flight(self.max_bytes)
+            flight.task = asyncio.create_task(self._pump(key, flight, start()))
+            self.started += 1
+        else:
+            self.joined += 1
+
+        subscriber = object()
+        position = flight.first
+        flight.positions[subscriber] = position
+        try:
+            while True:
+                while position < flight.end:
+                    yield flight.chunks[position - flight.first]
+                    position += 1
+                    flight.advance(subscriber, position)
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.leave(subscriber)
+            if not flight.positions and not flight.done:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await flight.task
+
+    async def call(self, key: str, start: Callable[[], Awaitable[str]]) -> str:
+        """Result of the in-flight call for `key`, starting it with `start()` if needed"""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(start()))
+            call.task.add_done_callback(
+                lambda task: self._calls.pop(key, None) if self._calls.get(key) is call else None
+            )
+            self.started += 1
+        else:
+            self.joined += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._streams) + len(self._calls),
+            "started": self.started,
+            "joined": self.joined,
+        }
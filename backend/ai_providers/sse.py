@@ -0,0 +1,148 @@
+import json
+from functools import partial
+from typing import Any, List, NamedTuple, Optional, Union
+
+Bytes = Union[bytes, bytearray, memoryview]
+
+# json.loads on bytes first sniffs the encoding in Python; decoding to str
+# in C and calling the decoder directly skips that per payload
+_decode_json = json.JSONDecoder().decode
+
+
+def loads(data: bytes) -> Any:
+    """Decode one UTF-8 JSON payload"""
+    return _decode_json(data.decode())
+
+
+class SSEEvent(NamedTuple):
+    event: Optional[str]
+    data: bytes
+    id: Optional[str]
+
+    def json(self) -> Any:
+        return loads(self.data)
+
+
+# Builds an SSEEvent from a tuple without the Python-level __new__
+_new_event = partial(tuple.__new__, SSEEvent)
+
+
+class _RollingBuffer:
+    """
+    Bytes received but not yet parsed, and how far they were searched.
+
+    Each read appends to a bytearray; `_take` finds the last complete
+    record boundary with `rfind` over only the bytes not searched before,
+    copies the complete records out once through a memoryview and drops
+    them from the front of the buffer. The unfinished record stays behind,
+    so a long record arriving in many small reads is never re-scanned or
+    re-split, and splitting the complete records happens in C.
+    """
+
+    _separator = b"\n"
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+
+    def _take(self, data: Bytes) -> Optional[bytes]:
+        buffer = self._buffer
+        buffer += data
+        # CRLF line endings are normalized in the new bytes only; one byte
+        # of overlap catches a CR and LF split across reads
+        overlap = max(0, self._scanned - 1)
+        if buffer.find(b"\r", overlap) != -1:
+            buffer[overlap:] = buffer[overlap:].replace(b"\r\n", b"\n")
+        # Bytes before the overlap did not move; search from the first
+        # separator that could end inside it
+        searched = max(0, overlap - len(self._separator) + 1)
+
+        end = buffer.rfind(self._separator, searched)
+        if end == -1:
+            self._scanned = len(buffer)
+            return None
+        with memoryview(buffer) as view:
+            records = bytes(view[:end])
+        del buffer[:end + len(self._separator)]
+        self._scanned = len(buffer)
+        return records
+
+
+class SSEDecoder(_RollingBuffer):
+    """
+    Incremental text/event-stream parser for upstream provider responses.
+
+    Feed it bytes as they arrive; it returns the events completed so far.
+    An event that is a single `data:` line, which is nearly every event
+    providers send, is sliced straight out of its block. Payloads stay
+    bytes; only `SSEEvent.json` decodes them. Lines end in LF or CRLF; as
+    the spec requires, an event cut off by the end of the stream is dropped.
+    """
+
+    _separator = b"\n\n"
+
+    def __init__(self):
+        super().__init__()
+        self._id: Optional[str] = None
+
+    def feed(self, data: Bytes) -> List[SSEEvent]:
+        """Parse `data` and return the events it completes"""
+        records = self._take(data)
+        if records is None:
+            return []
+
+        blocks = records.split(b"\n\n")
+        last_id = self._id
+        if records.count(b"\n") == 2 * (len(blocks) - 1) and b"id:" not in records:
+            # Every event is one line: keep the data lines (a bare "data"
+            # is an empty one), skip comments
+            return [
+                _new_event((None, block[6:] if block[5:6] == b" " else block[5:], last_id))
+                for block in blocks
+                if block[:5] == b"data:" or block == b"data"
+            ]
+
+        events: List[SSEEvent] = []
+        for block in blocks:
+            if block[:5] == b"data:" and b"\n" not in block:
+                events.append(
+                    _new_event((None, block[6:] if block[5:6] == b" " else block[5:], self._id))
+                )
+            elif block:
+                event = self._block(block)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def _block(self, block: bytes) -> Optional[SSEEvent]:
+        event = None
+        data: List[bytes] = []
+        for line in block.split(b"\n"):
+            # Comments (":") have an empty field name and are ignored
+            field, _, value = line.partition(b":")
+            if value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                data.append(value)
+            elif field == b"event":
+                event = value.decode()
+            elif field == b"id":
+                self._id = value.decode()
+        if not data:
+            return None
+        return SSEEvent(event, b"\n".join(data), self._id)
+
+
+class NDJSONDecoder(_RollingBuffer):
+    """Incremental newline-delimited JSON parser; blank lines are skipped"""
+
+    def feed(self, data: Bytes) -> List[Any]:
+        """Parse `data` and return the objects of the lines it completes"""
+        records = self._take(data)
+        if records is None:
+            return []
+        return [loads(line) for line in records.split(b"\n") if line.strip()]
+
+    def flush(self) -> List[Any]:
+        """The last object, if the stream did not end with a newline"""
+        return self.feed(b"\n") if self._buffer.strip() else []
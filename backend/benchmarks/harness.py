@@ -0,0 +1,151 @@
+"""
+Shared helpers for driving the FastAPI app in-process.
+
+Import this before `main`: it points DATABASE_URL at a throwaway SQLite
+file unless one is already configured.
+"""
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+)
+
+from jose import jwt
+
+USER_ID = "bench-user"
+
+
+def make_token(user_id: str = USER_ID) -> str:
+    """An HS256 token for `user_id`, signed with SUPABASE_JWT_SECRET if set"""
+    secret = os.getenv("SUPABASE_JWT_SECRET", "bench-secret")
+    claims = {
+        "sub": user_id,
+        "email": f"{user_id}@example.com",
+        "aud": "authenticated",
+        "exp": int(time.time()) + 3600,
+    }
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def seed_database(provider_id: str, model: str, user_id: str = USER_ID):
+    """Create the schema plus one user with `provider_id` selected"""
+    from database import SessionLocal, upsert
+    from migrations import upgrade
+    from models import User, UserAiModels, UserSelectedAiModel
+
+    upgrade()
+    with SessionLocal() as db:
+        db.execute(
+            upsert(User)
+            .values(id=user_id, email=f"{user_id}@example.com")
+            .on_conflict_do_nothing()
+        )
+        db.execute(
+            upsert(UserAiModels)
+            .values(
+                user_id=user_id,
+                model_id=provider_id,
+                name=provider_id,
+                model=model,
+                api_key="bench-key",
+            )
+            .on_conflict_do_nothing()
+        )
+        db.execute(
+            upsert(UserSelectedAiModel)
+            .values(user_id=user_id, model_id=provider_id)
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+
+
+async def asgi_request(app, method, path, body=None, headers=None):
+    """
+    Run one request against an ASGI app without a server.
+
+    Returns:
+        (status, chunks, timestamps) where timestamps holds the
+        perf_counter time at which each body chunk was sent
+    """
+    payload = json.dumps(body).encode() if body is not None else b""
+    raw_headers = [(b"content-type", b"application/json")]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = None
+    chunks = []
+    timestamps = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"])
+            timestamps.append(time.perf_counter())
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return status, chunks, timestamps
+
+
+def percentiles(values, points=(50, 95, 99)) -> dict:
+    """Selected percentiles plus the max, in the units of `values`"""
+    if not values:
+        return {f"p{p}": None for p in points} | {"max": None}
+
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+        result[f"p{p}"] = ordered[index]
+    result["max"] = ordered[-1]
+    result["mean"] = statistics.fmean(ordered)
+    return result
+
+
+def process_memory(pid="self") -> dict:
+    """Current and peak resident set size of a process, in MiB (Linux)"""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return memory
@@ -0,0 +1,121 @@
+"""
+Cold start: how long `import main` takes in a fresh interpreter.
+
+Each run starts a new Python with `-X importtime`, which is what a
+serverless cold start pays before the first request. Reports the median
+total over --runs, the slowest top-level imports of the module, and
+fails (exit 1) when the median is over --budget-ms or a module listed in
+--forbid was imported: those SDKs should load on first use, not at
+startup.
+
+Run from backend/:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 10 --budget-ms 1500 --json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+# Loaded lazily through ProviderRegistry; importing them at startup is a regression
+FORBIDDEN = ("google.ai.generativelanguage", "google.generativeai", "grpc")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(module: str) -> list:
+    """(cumulative us, depth, name) for every import made by `import module`"""
+    env = os.environ.copy()
+    # Importing must not need a database; this only has to be a valid URL
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/import_time.db")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            depth = len(match[3]) // 2
+            imports.append((int(match[2]), depth, match[4]))
+    return imports
+
+
+def run(args) -> dict:
+    totals, slowest, loaded = [], {}, set()
+    for _ in range(args.runs):
+        imports = profile(args.module)
+        loaded.update(name for _, _, name in imports)
+        total = next(us for us, depth, name in imports if name == args.module and depth == 0)
+        totals.append(total / 1000)
+        # Direct imports of the module; each run keeps its own times
+        for us, depth, name in imports:
+            if depth == 1:
+                slowest.setdefault(name, []).append(us / 1000)
+
+    top = sorted(
+        ((name, statistics.median(times)) for name, times in slowest.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:args.top]
+    forbidden = [
+        f for f in args.forbid
+        if any(name == f or name.startswith(f + ".") for name in loaded)
+    ]
+    return {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": statistics.median(totals),
+        "min_ms": min(totals),
+        "max_ms": max(totals),
+        "slowest_imports_ms": dict(top),
+        "forbidden_imported": forbidden,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, help="fail above this median")
+    parser.add_argument("--forbid", nargs="*", default=FORBIDDEN, help="modules that must not load")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(
+            f"import {result['module']}: median {result['median_ms']:.0f} ms "
+            f"(min {result['min_ms']:.0f}, max {result['max_ms']:.0f}) over {result['runs']} runs"
+        )
+        for name, ms in result["slowest_imports_ms"].items():
+            print(f"  {ms:>8.1f} ms  {name}")
+
+    failed = False
+    if result["forbidden_imported"]:
+        print(f"imported at startup: {', '.join(result['forbidden_imported'])}", file=sys.stderr)
+        failed = True
+    if args.budget_ms is not None and result["median_ms"] > args.budget_ms:
+        print(f"median {result['median_ms']:.0f} ms is over {args.budget_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
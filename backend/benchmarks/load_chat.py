@@ -0,0 +1,228 @@
+"""
+Load test: the chat pipeline end to end against the mock provider.
+
+Runs --clients concurrent clients, each sending --requests chat requests
+back to back to /chats (streaming) or /chat. Requests go through ASGI in
+this process, or over HTTP to a uvicorn server started on a free port.
+The mock provider is paced by the seeded model's settings, so anything
+beyond that pacing is our own overhead: auth, database lookups,
+scheduling, buffering and SSE framing. Every request sends a distinct
+message so single-flight does not merge them.
+
+Reports time to first byte, gaps between body chunks, throughput and the
+serving process's RSS. Use --json for a machine-readable result.
+
+Run from backend/:
+
+    python -m benchmarks.load_chat
+    python -m benchmarks.load_chat --server uvicorn --clients 200 --tokens 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+os.environ["MOCK_PROVIDER"] = "1"
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+# One bench user and key stand in for many real ones
+os.environ.setdefault("SCHEDULER_KEY_CONCURRENCY", "0")
+
+from benchmarks.harness import (
+    asgi_request,
+    make_token,
+    percentiles,
+    process_memory,
+    seed_database,
+)
+
+
+def _mock_model(args) -> str:
+    return (
+        f"tokens={args.tokens},delay_ms={args.delay_ms},"
+        f"first_token_ms={args.first_token_ms},error_rate={args.error_rate}"
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class InProcessTarget:
+    """Requests straight into the ASGI app"""
+
+    def __init__(self):
+        import main
+
+        self.app = main.app
+
+    async def request(self, path, body, headers):
+        start = time.perf_counter()
+        status, chunks, timestamps = await asgi_request(
+            self.app, "POST", path, body=body, headers=headers
+        )
+        return status, start, chunks, timestamps
+
+    def memory(self) -> dict:
+        return process_memory()
+
+    async def close(self):
+        pass
+
+
+class UvicornTarget:
+    """Requests over loopback HTTP to a uvicorn worker in a subprocess"""
+
+    def __init__(self, clients: int):
+        import httpx
+
+        port = _free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            env=os.environ.copy(),
+        )
+        self.client = httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}",
+            limits=httpx.Limits(max_connections=clients, max_keepalive_connections=clients),
+            timeout=None,
+        )
+
+    async def wait_ready(self, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                await self.client.get("/")
+                return
+            except Exception:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                await asyncio.sleep(0.1)
+
+    async def request(self, path, body, headers):
+        start = time.perf_counter()
+        chunks, timestamps = [], []
+        async with self.client.stream("POST", path, json=body, headers=headers) as response:
+            async for chunk in response.aiter_raw():
+                chunks.append(chunk)
+                timestamps.append(time.perf_counter())
+        return response.status_code, start, chunks, timestamps
+
+    def memory(self) -> dict:
+        return process_memory(self.process.pid)
+
+    async def close(self):
+        await self.client.aclose()
+        self.process.terminate()
+        self.process.wait()
+
+
+async def run(args) -> dict:
+    seed_database("mock", _mock_model(args))
+    if args.server == "uvicorn":
+        target = UvicornTarget(args.clients)
+        await target.wait_ready()
+    else:
+        target = InProcessTarget()
+
+    path = "/chats" if args.endpoint == "chats" else "/chat"
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    ttfb, gaps = [], []
+    counts = {"ok": 0, "errors": 0, "chunks": 0, "bytes": 0}
+
+    async def send(client: int, request: int, record: bool = True):
+        body = {"messages": [{"role": "user", "content": f"load test {client} {request} go"}]}
+        status, start, chunks, timestamps = await target.request(path, body, headers)
+        if not record:
+            return
+        if status != 200 or any(b"event: error" in chunk for chunk in chunks):
+            counts["errors"] += 1
+            return
+        counts["ok"] += 1
+        counts["chunks"] += len(chunks)
+        counts["bytes"] += sum(map(len, chunks))
+        if timestamps:
+            ttfb.append((timestamps[0] - start) * 1000)
+            gaps.extend((b - a) * 1000 for a, b in zip(timestamps, timestamps[1:]))
+
+    async def client(n: int):
+        for request in range(args.requests):
+            await send(n, request)
+
+    try:
+        for warmup in range(args.warmup):
+            await send(-1, warmup, record=False)
+        started = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        memory = target.memory()
+    finally:
+        await target.close()
+
+    return {
+        "server": args.server,
+        "endpoint": args.endpoint,
+        "clients": args.clients,
+        "requests": args.clients * args.requests,
+        "mock_model": _mock_model(args),
+        "ok": counts["ok"],
+        "errors": counts["errors"],
+        "elapsed_s": elapsed,
+        "requests_per_s": (counts["ok"] + counts["errors"]) / elapsed,
+        "chunks_per_s": counts["chunks"] / elapsed,
+        "mib_per_s": counts["bytes"] / elapsed / 1048576,
+        "ttfb_ms": percentiles(ttfb),
+        "chunk_gap_ms": percentiles(gaps),
+        **memory,
+    }
+
+
+def _print_report(result: dict):
+    print(
+        f"{result['requests']} requests to {result['endpoint']} ({result['server']}), "
+        f"{result['clients']} clients, mock {result['mock_model']}"
+    )
+    print(
+        f"ok {result['ok']}  errors {result['errors']}  "
+        f"{result['requests_per_s']:.1f} req/s  {result['chunks_per_s']:.0f} chunks/s  "
+        f"{result['mib_per_s']:.2f} MiB/s"
+    )
+    print(f"{'ms':<12}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name in ("ttfb_ms", "chunk_gap_ms"):
+        values = result[name]
+        if values["max"] is None:
+            continue
+        print(
+            f"{name:<12}" + "".join(f"{values[p]:>9.1f}" for p in ("p50", "p95", "p99", "max"))
+        )
+    if result["rss_mb"] is not None:
+        print(f"rss {result['rss_mb']:.0f} MiB (peak {result['peak_rss_mb']:.0f} MiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--endpoint", choices=("chats", "chat"), default="chats")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=4, help="per client")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    parser.add_argument("--first-token-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        _print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Micro-benchmarks: per-request overhead of the main.py hot paths.
+
+Times the pieces every chat request pays for, on a throwaway SQLite
+database (or DATABASE_URL, e.g. a local Postgres):
+
+    token      validate_supabase_token, HS256, cold and cached
+    resolve    resolve_selected_model, cold and cached
+    gemini     GeminiProvider._convert_messages_to_gemini_format
+    validate   ChatRequest validation of large payloads
+    serialize  ModelResponse serialization of a GET /ai-models body
+    endpoint   GET /ai-models and POST /chats (mock provider) through ASGI
+
+Each benchmark reports the best mean time per call over --repeat
+rounds. Results are written as JSON (benchmarks/results/<commit>.json by
+default), and `compare` diffs two result files, exiting non-zero when
+anything slowed down by more than --threshold.
+
+Run from backend/:
+
+    python -m benchmarks.overhead
+    python -m benchmarks.overhead --filter gemini --output /tmp/after.json
+    python -m benchmarks.overhead compare benchmarks/results/a1b2c3d.json /tmp/after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ["MOCK_PROVIDER"] = "1"
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+os.environ.setdefault("SCHEDULER_KEY_CONCURRENCY", "0")
+
+from benchmarks.harness import USER_ID, asgi_request, make_token, seed_database
+
+RESULTS_DIR = Path(__file__).parent / "results"
+HISTORY_SIZES = (10, 100, 1000)
+
+
+def _history(size: int, content_size: int = 200):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "x" * content_size}
+        for i in range(size)
+    ]
+
+
+def _time_sync(fn, number: int, repeat: int):
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return rounds
+
+
+async def _time_async(fn, number: int, repeat: int):
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return rounds
+
+
+def _benchmarks():
+    """(name, kind, callable, number) for every benchmark"""
+    import supabase
+    from ai_providers.gemini import GeminiProvider
+    from database import session_scope
+    from model_resolver import _selected_model_cache, resolve_selected_model
+    from models import UserAiModels
+    from pydantic import TypeAdapter
+    from schema import ChatRequest, ModelResponse
+
+    import main
+
+    token = make_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def token_cold():
+        supabase._verified_tokens.clear()
+        await supabase.validate_supabase_token(token)
+
+    async def token_cached():
+        await supabase.validate_supabase_token(token)
+
+    async def resolve(cold: bool):
+        if cold:
+            _selected_model_cache.clear()
+        async with session_scope() as db:
+            await resolve_selected_model(db, USER_ID)
+
+    yield "token.cold", "async", token_cold, 200
+    yield "token.cached", "async", token_cached, 2000
+    yield "resolve.cold", "async", lambda: resolve(True), 200
+    yield "resolve.cached", "async", lambda: resolve(False), 1000
+
+    # The conversion never touches the client, so skip building one
+    gemini = object.__new__(GeminiProvider)
+    for size in HISTORY_SIZES:
+        history = _history(size)
+        yield (
+            f"gemini.convert.{size}",
+            "sync",
+            lambda history=history: gemini._convert_messages_to_gemini_format(history),
+            max(10, 10000 // size),
+        )
+
+    for size in HISTORY_SIZES:
+        payload = json.dumps({"messages": _history(size, 1000)})
+        yield (
+            f"validate.chat_request.{size}",
+            "sync",
+            lambda payload=payload: ChatRequest.model_validate_json(payload),
+            max(10, 5000 // size),
+        )
+
+    rows = [
+        UserAiModels(
+            id=uuid.uuid4(),
+            user_id=USER_ID,
+            model_id=f"provider-{i}",
+            name=f"Model {i}",
+            model=f"model-{i}",
+            api_key="k" * 40,
+        )
+        for i in range(50)
+    ]
+    adapter = TypeAdapter(list[ModelResponse])
+    yield (
+        "serialize.ai_models.50",
+        "sync",
+        lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True)),
+        1000,
+    )
+
+    async def get_models():
+        status, _, _ = await asgi_request(main.app, "GET", "/ai-models", headers=headers)
+        assert status == 200, status
+
+    async def post_chats():
+        status, _, _ = await asgi_request(
+            main.app,
+            "POST",
+            "/chats",
+            body={"messages": [{"role": "user", "content": f"bench {time.perf_counter()}"}]},
+            headers=headers,
+        )
+        assert status == 200, status
+
+    yield "endpoint.get_ai_models", "async", get_models, 200
+    yield "endpoint.post_chats", "async", post_chats, 200
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _run(args) -> dict:
+    # One token-sized chunk with no pacing: what remains is our overhead
+    seed_database("mock", "tokens=1,delay_ms=0")
+    results = {}
+    for name, kind, fn, number in _benchmarks():
+        if args.filter and args.filter not in name:
+            continue
+        number = max(1, int(number * args.scale))
+        if kind == "async":
+            await fn()
+            rounds = await _time_async(fn, number, args.repeat)
+        else:
+            fn()
+            rounds = _time_sync(fn, number, args.repeat)
+        results[name] = {
+            "best_us": min(rounds) * 1e6,
+            "median_us": statistics.median(rounds) * 1e6,
+            "number": number,
+            "repeat": args.repeat,
+        }
+        print(f"{name:<32}{results[name]['best_us']:>12.1f} us", file=sys.stderr)
+
+    return {
+        "commit": _commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "results": results,
+    }
+
+
+def compare(baseline_path: str, current_path: str, threshold: float) -> int:
+    """Print the change per benchmark; non-zero exit if any slowed past `threshold`"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    current = json.loads(Path(current_path).read_text())
+    print(f"{baseline['commit']} -> {current['commit']}")
+    print(f"{'benchmark':<32}{'before us':>12}{'after us':>12}{'change':>9}")
+    regressed = False
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<32}{'-':>12}{result['best_us']:>12.1f}{'new':>9}")
+            continue
+        change = result["best_us"] / before["best_us"] - 1
+        flag = " !" if change > threshold else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:<32}{before['best_us']:>12.1f}{result['best_us']:>12.1f}{change:>+8.0%}{flag}")
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", nargs="?", choices=("run", "compare"), default="run")
+    parser.add_argument("files", nargs="*", help="compare: baseline and current JSON")
+    parser.add_argument("--filter", help="only benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iterations")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="compare: slowdown to flag")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs a baseline and a current result file")
+        sys.exit(compare(*args.files, args.threshold))
+
+    report = asyncio.run(_run(args))
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
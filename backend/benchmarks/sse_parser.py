@@ -0,0 +1,129 @@
+"""
+Micro-benchmark: ai_providers.sse decoders against naive split parsing.
+
+The naive parsers mirror frontend/lib/ai/chat-service.ts: decode each read
+into a string buffer, `split("\\n")` the whole buffer and keep the last
+piece. That re-scans the unfinished line on every read, so a long event
+arriving in small reads costs time quadratic in its size. Each scenario
+parses a multi-megabyte stream fed in fixed-size reads and extracts every
+delta's text, so both sides decode the same JSON.
+
+Run from backend/:
+
+    python -m benchmarks.sse_parser
+    python -m benchmarks.sse_parser --megabytes 16 --read-size 4096
+"""
+import argparse
+import json
+import time
+
+from ai_providers.sse import NDJSONDecoder, SSEDecoder
+
+
+def openai_stream(total_bytes: int, text_size: int) -> bytes:
+    """Chat completion chunks, each carrying `text_size` characters"""
+    event = b"data: " + json.dumps(
+        {"choices": [{"index": 0, "delta": {"content": "x" * text_size}}]}
+    ).encode() + b"\n\n"
+    return event * max(1, total_bytes // len(event)) + b"data: [DONE]\n\n"
+
+
+def ndjson_stream(total_bytes: int, text_size: int) -> bytes:
+    """Ollama-style NDJSON lines, each carrying `text_size` characters"""
+    line = json.dumps({"message": {"content": "x" * text_size}, "done": False}).encode() + b"\n"
+    return line * max(1, total_bytes // len(line))
+
+
+def reads(stream: bytes, size: int):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def naive_sse(chunks) -> int:
+    buffer = ""
+    characters = 0
+    for chunk in chunks:
+        buffer += chunk.decode()
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.startswith("data: "):
+                data = line[6:]
+                if data == "[DONE]":
+                    return characters
+                characters += len(json.loads(data)["choices"][0]["delta"]["content"])
+    return characters
+
+
+def decoder_sse(chunks) -> int:
+    decoder = SSEDecoder()
+    characters = 0
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event.data == b"[DONE]":
+                return characters
+            characters += len(event.json()["choices"][0]["delta"]["content"])
+    return characters
+
+
+def naive_ndjson(chunks) -> int:
+    buffer = ""
+    characters = 0
+    for chunk in chunks:
+        buffer += chunk.decode()
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                characters += len(json.loads(line)["message"]["content"])
+    return characters
+
+
+def decoder_ndjson(chunks) -> int:
+    decoder = NDJSONDecoder()
+    characters = 0
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            characters += len(item["message"]["content"])
+    for item in decoder.flush():
+        characters += len(item["message"]["content"])
+    return characters
+
+
+def best_of(repeats: int, parse, chunks) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        parse(chunks)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--read-size", type=int, default=16384)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    total = int(args.megabytes * 1024 * 1024)
+
+    scenarios = [
+        # Typical token deltas, and large events spanning many reads
+        ("sse small events", openai_stream(total, 16), naive_sse, decoder_sse),
+        ("sse 256KiB events", openai_stream(total, 256 * 1024), naive_sse, decoder_sse),
+        ("ndjson small lines", ndjson_stream(total, 16), naive_ndjson, decoder_ndjson),
+        ("ndjson 256KiB lines", ndjson_stream(total, 256 * 1024), naive_ndjson, decoder_ndjson),
+    ]
+    print(f"{'scenario':<22}{'naive ms':>10}{'decoder ms':>12}{'MiB/s':>9}{'speedup':>9}")
+    for name, stream, naive, decoder in scenarios:
+        chunks = reads(stream, args.read_size)
+        assert naive(chunks) == decoder(chunks), name
+        naive_time = best_of(args.repeats, naive, chunks)
+        decoder_time = best_of(args.repeats, decoder, chunks)
+        print(
+            f"{name:<22}{naive_time * 1000:>10.1f}{decoder_time * 1000:>12.1f}"
+            f"{len(stream) / 1048576 / decoder_time:>9.1f}{naive_time / decoder_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
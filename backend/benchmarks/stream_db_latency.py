@@ -0,0 +1,181 @@
+"""
+Load test: streaming chunk latency while CRUD traffic hits the database.
+
+Streams /chats responses from a provider that emits a token at a fixed
+interval while other clients hammer the model endpoints. Every SQL
+statement is slowed down in the thread that executes it, which is what a
+remote Postgres looks like to the app. CRUD clients only read by default
+because SQLite serialises writers; add --writes when DATABASE_URL points
+at Postgres. Compares:
+
+    blocking  sync session on the event loop (the old behaviour)
+    threaded  sync session in the bounded DB thread pool (DATABASE_ASYNC=0)
+    async     SQLAlchemy asyncio session (DATABASE_ASYNC=1)
+
+Run from backend/:
+
+    python -m benchmarks.stream_db_latency
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = ("blocking", "threaded", "async")
+
+
+def _install_statement_latency(latency: float):
+    """Sleep before each statement, in whichever thread executes it"""
+    from sqlalchemy import event
+    import database
+
+    def slow(statement):
+        time.sleep(latency)
+
+    @event.listens_for(database.engine, "connect")
+    def on_sync_connect(dbapi_connection, connection_record):
+        if hasattr(dbapi_connection, "set_trace_callback"):
+            dbapi_connection.set_trace_callback(slow)
+
+    if database.async_engine is not None:
+
+        @event.listens_for(database.async_engine.sync_engine, "connect")
+        def on_async_connect(dbapi_connection, connection_record):
+            if database.async_engine.dialect.name == "sqlite":
+                dbapi_connection.run_async(lambda conn: conn.set_trace_callback(slow))
+
+
+def _register_ticking_provider(interval: float, tokens: int):
+    from ai_providers.base import AIProvider, ProviderRegistry
+
+    @ProviderRegistry.register("ticker")
+    class TickerProvider(AIProvider):
+        """Emits `tokens` chunks, one every `interval` seconds"""
+
+        async def stream_chat(self, messages, on_chunk):
+            for i in range(tokens):
+                await asyncio.sleep(interval)
+                on_chunk({"content": f"t{i} ", "isComplete": False, "error": None})
+            on_chunk({"content": "", "isComplete": True, "error": None})
+
+        async def generate_response(self, messages):
+            return "ok"
+
+
+async def _run_mode(args) -> dict:
+    from benchmarks.harness import asgi_request, make_token, percentiles, seed_database
+
+    _install_statement_latency(args.db_latency_ms / 1000)
+    _register_ticking_provider(args.token_interval_ms / 1000, args.tokens)
+
+    import database
+    import main
+
+    if args.mode == "blocking":
+
+        class InlineSession(database.ThreadedSession):
+            async def _run(self, fn, *fn_args, **kwargs):
+                return fn(*fn_args, **kwargs)
+
+        async def inline_get_db():
+            session = InlineSession(database.SessionLocal())
+            try:
+                yield session
+            finally:
+                await session.close()
+
+        main.app.dependency_overrides[database.get_db] = inline_get_db
+
+    seed_database("ticker", "ticker-1")
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    chat_body = {"messages": [{"role": "user", "content": "hello"}]}
+    stop = asyncio.Event()
+    crud_requests = 0
+
+    async def crud_client(n):
+        nonlocal crud_requests
+        while not stop.is_set():
+            if not args.writes or n % 2:
+                await asgi_request(main.app, "GET", "/ai-models", headers=headers)
+            else:
+                await asgi_request(
+                    main.app,
+                    "PUT",
+                    "/models/selected",
+                    body={"model_id": "ticker"},
+                    headers=headers,
+                )
+            crud_requests += 1
+            # Stands in for the network turnaround between requests
+            await asyncio.sleep(0)
+
+    async def stream_client():
+        start = time.perf_counter()
+        _, _, timestamps = await asgi_request(
+            main.app, "POST", "/chats", body=chat_body, headers=headers
+        )
+        marks = [start] + timestamps
+        return [b - a for a, b in zip(marks, marks[1:])]
+
+    crud_tasks = [asyncio.create_task(crud_client(n)) for n in range(args.crud_clients)]
+    started = time.perf_counter()
+    gaps = await asyncio.gather(*(stream_client() for _ in range(args.streams)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*crud_tasks)
+
+    gaps_ms = [gap * 1000 for stream in gaps for gap in stream[1:]]
+    return {
+        "mode": args.mode,
+        "chunk_gap_ms": percentiles(gaps_ms),
+        "crud_requests_per_s": crud_requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-interval-ms", type=float, default=10)
+    parser.add_argument("--crud-clients", type=int, default=20)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--writes", action="store_true")
+    args = parser.parse_args()
+
+    if args.mode:
+        os.environ["DATABASE_ASYNC"] = "1" if args.mode == "async" else "0"
+        # Measure the gap between upstream chunks, not the SSE flush timer
+        os.environ.setdefault("SSE_FLUSH_MS", "0")
+        os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+        print(json.dumps(asyncio.run(_run_mode(args))))
+        return
+
+    # Each mode needs a fresh process: the engines are created at import
+    print(
+        f"{args.streams} streams x {args.tokens} tokens every "
+        f"{args.token_interval_ms}ms, {args.crud_clients} CRUD clients, "
+        f"{args.db_latency_ms}ms per statement\n"
+    )
+    print(f"{'mode':<10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'crud/s':>9}")
+    for mode in MODES:
+        argv = sys.argv[1:] + ["--mode", mode]
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.stream_db_latency", *argv],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        gaps = result["chunk_gap_ms"]
+        print(
+            f"{mode:<10}{gaps['p50']:>9.1f}{gaps['p99']:>9.1f}"
+            f"{gaps['max']:>9.1f}{result['crud_requests_per_s']:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
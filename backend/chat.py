@@ -0,0 +1,84 @@
+from typing import Optional
+from ai_providers.ai_service import ai_service
+from conversations import ConversationHistory, append_messages, load_history
+from database import DBSession
+from response_cache import response_cache, response_cache_key
+from schema import ChatRequest
+
+
+class ChatRequestError(Exception):
+    """A chat request that cannot be served as sent"""
+
+    def __init__(self, status_code: int, error: str):
+        self.status_code = status_code
+        self.error = error
+
+
+def check_chat_request(data: ChatRequest) -> None:
+    """Reject requests that name neither a history nor a conversation"""
+    if data.conversation_id is None:
+        if not data.messages:
+            raise ChatRequestError(400, "messages or conversation_id is required")
+    elif data.message is None:
+        raise ChatRequestError(400, "message is required with conversation_id")
+
+
+async def chat_messages(
+    db: DBSession, user_id: str, data: ChatRequest
+) -> tuple[list[dict], Optional[ConversationHistory], Optional[dict]]:
+    """
+    Messages to send to the provider for this request.
+
+    With a conversation_id the stored history is reused and only the new
+    message comes from the client; the history and that message are
+    returned so the turn can be stored once the reply is complete.
+    """
+    check_chat_request(data)
+    if data.conversation_id is None:
+        # Convert messages to dict format
+        return [{"role": msg.role, "content": msg.content} for msg in data.messages], None, None
+
+    history = await load_history(db, user_id, data.conversation_id)
+    if history is None:
+        raise ChatRequestError(404, "Conversation not found")
+
+    message = {"role": data.message.role, "content": data.message.content}
+    return history.messages + [message], history, message
+
+
+def chat_cache_key(selected, messages: list[dict]) -> Optional[str]:
+    """Response cache key for this request, or None with the cache off"""
+    if response_cache is None:
+        return None
+    return response_cache_key(selected.model_id, selected.model, messages)
+
+
+async def chat_reply(db: DBSession, user_id: str, selected, data: ChatRequest) -> dict:
+    """The complete reply to one chat request, stored in its conversation if any"""
+    messages, history, message = await chat_messages(db, user_id, data)
+    cache_key = chat_cache_key(selected, messages)
+
+    response = await response_cache.get(cache_key) if cache_key else None
+    if response is None:
+        # Generate response using AI service
+        response = await ai_service.generate_response(
+            messages,
+            selected.model_id,  # provider_id (e.g., "gemini")
+            selected.api_key,
+            selected.model,  # model name
+            conversation_id=history.id if history else None,
+            user_id=user_id,
+        )
+        if cache_key:
+            await response_cache.set(cache_key, response)
+
+    if history is not None:
+        await append_messages(
+            db, history, [message, {"role": "assistant", "content": response}]
+        )
+        return {
+            "success": True,
+            "response": response,
+            "conversation_id": str(history.id),
+        }
+    return {"success": True, "response": response}
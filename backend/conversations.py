@@ -0,0 +1,141 @@
+import os
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert, select, update
+from cache import TTLCache
+from database import DBSession
+from models import Conversation, ConversationMessage
+
+# Message history of recently used conversations, keyed by conversation id
+_history_cache = TTLCache(
+    maxsize=int(os.getenv("CONVERSATION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "900")),
+)
+
+
+class ConversationConflict(Exception):
+    """Another request appended to the conversation first"""
+
+
+@dataclass
+class ConversationHistory:
+    """A conversation's messages in the format providers take"""
+
+    id: uuid.UUID
+    user_id: str
+    messages: List[Dict[str, str]] = field(default_factory=list)
+
+
+async def create_conversation(
+    db: DBSession, user_id: str, title: Optional[str] = None
+) -> Conversation:
+    conversation = Conversation(user_id=user_id, title=title, message_count=0)
+    db.add(conversation)
+    await db.commit()
+    _history_cache.set(conversation.id, ConversationHistory(conversation.id, user_id))
+    return conversation
+
+
+async def load_history(
+    db: DBSession, user_id: str, conversation_id: uuid.UUID
+) -> Optional[ConversationHistory]:
+    """
+    Return the conversation's messages, or None if the user does not own it.
+
+    Costs one primary-key lookup when the cached history is current. A
+    history that another worker has since extended only loads the
+    messages it is missing. Each caller gets its own copy, so the length
+    `append_messages` checks is the one this turn was built on.
+    """
+    message_count = await db.scalar(
+        select(Conversation.message_count).where(
+            Conversation.id == conversation_id, Conversation.user_id == user_id
+        )
+    )
+    if message_count is None:
+        return None
+
+    history = _history_cache.get(conversation_id)
+    if history is None or len(history.messages) > message_count:
+        history = ConversationHistory(conversation_id, user_id)
+
+    if len(history.messages) < message_count:
+        rows = await db.execute(
+            select(ConversationMessage.role, ConversationMessage.content)
+            .where(
+                ConversationMessage.conversation_id == conversation_id,
+                ConversationMessage.seq >= len(history.messages),
+            )
+            .order_by(ConversationMessage.seq)
+        )
+        # Cached histories are never changed in place; requests may be using them
+        history = ConversationHistory(
+            conversation_id,
+            user_id,
+            history.messages + [{"role": role, "content": content} for role, content in rows],
+        )
+
+    _history_cache.set(conversation_id, history)
+    return replace(history, messages=list(history.messages))
+
+
+async def append_messages(
+    db: DBSession, history: ConversationHistory, messages: List[Dict[str, str]]
+) -> None:
+    """
+    Store `messages` after the history's last message and commit.
+
+    Raises:
+        ConversationConflict: The conversation changed since it was loaded
+    """
+    seq = len(history.messages)
+    result = await db.execute(
+        update(Conversation)
+        .where(Conversation.id == history.id, Conversation.message_count == seq)
+        .values(
+            message_count=seq + len(messages),
+            updated_at=datetime.now(timezone.utc),
+        )
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        _history_cache.delete(history.id)
+        raise ConversationConflict(f"Conversation {history.id} was modified concurrently")
+
+    await db.execute(
+        insert(ConversationMessage),
+        [
+            {
+                "conversation_id": history.id,
+                "seq": seq + offset,
+                "role": message["role"],
+                "content": message["content"],
+            }
+            for offset, message in enumerate(messages)
+        ],
+    )
+    await db.commit()
+    history.messages.extend(messages)
+    _history_cache.set(history.id, replace(history, messages=list(history.messages)))
+
+
+async def delete_conversation(db: DBSession, user_id: str, conversation_id: uuid.UUID) -> bool:
+    """Delete the conversation and its messages; False if the user does not own it"""
+    result = await db.execute(
+        delete(Conversation).where(
+            Conversation.id == conversation_id, Conversation.user_id == user_id
+        )
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+
+    # Not every database enforces ON DELETE CASCADE
+    await db.execute(
+        delete(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id)
+    )
+    await db.commit()
+    _history_cache.delete(conversation_id)
+    return True
@@ -1,12 +1,205 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import FrozenResult, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Optional, Union
+import asyncio
+import functools
 import os
 from dotenv import load_dotenv
+from metrics import instrument_engine
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine)
+instrument_engine(engine)
+# Objects stay usable after commit without a lazy reload on the event loop
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 Base = declarative_base()
+
+# Async drivers for the sync drivers DATABASE_URL may name
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_database_url() -> Optional[str]:
+    """DATABASE_ASYNC_URL, or DATABASE_URL rewritten for its async driver"""
+    if os.getenv("DATABASE_ASYNC_URL"):
+        return os.getenv("DATABASE_ASYNC_URL")
+
+    url = make_url(DATABASE_URL)
+    drivername = _ASYNC_DRIVERS.get(url.drivername)
+    if drivername is None:
+        return None
+
+    url = url.set(drivername=drivername)
+    # asyncpg spells libpq's sslmode as ssl
+    if "sslmode" in url.query and drivername.endswith("asyncpg"):
+        url = url.difference_update_query(["sslmode"]).update_query_dict(
+            {"ssl": url.query["sslmode"]}
+        )
+    return url.render_as_string(hide_password=False)
+
+
+def _create_async_engine():
+    if os.getenv("DATABASE_ASYNC", "1") == "0":
+        return None
+
+    url = _async_database_url()
+    if url is None:
+        return None
+
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        return create_async_engine(url, pool_pre_ping=True)
+    except ImportError:
+        # greenlet or the async driver is not installed; use the thread pool
+        return None
+
+
+async_engine = _create_async_engine()
+AsyncSessionLocal = None
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    instrument_engine(async_engine.sync_engine)
+
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Bounds how many sync sessions hit the database at once in fallback mode
+_db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_THREADPOOL_SIZE", "8")),
+    thread_name_prefix="db",
+)
+
+
+def _pool_capacity(pool) -> int:
+    size = pool.size() if callable(getattr(pool, "size", None)) else 1
+    return max(1, size + max(0, getattr(pool, "_max_overflow", 0)))
+
+
+# Sessions holding a connection never outnumber the pool, so a worker thread
+# can't block on checkout while the holders wait for a thread to close
+_session_slots = asyncio.Semaphore(_pool_capacity(engine.pool))
+
+
+class ThreadedSession:
+    """
+    Awaitable facade over a sync Session.
+
+    Mirrors the subset of the AsyncSession API the endpoints use, running
+    each blocking call in the bounded DB thread pool instead of on the
+    event loop.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+        self._holds_slot = False
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    async def _run(self, fn, *args, **kwargs):
+        if not self._holds_slot:
+            await _session_slots.acquire()
+            self._holds_slot = True
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _db_executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    def _execute_buffered(self, statement, params=None, **kwargs):
+        result = self.sync_session.execute(statement, params, **kwargs)
+        if not getattr(result, "returns_rows", True):
+            return result
+        # Fetch rows on the worker thread, like AsyncSession does
+        try:
+            return result.freeze()
+        except NotImplementedError:
+            # ORM bulk INSERT without RETURNING has no rows to fetch
+            return result
+
+    async def execute(self, statement, params=None, **kwargs):
+        result = await self._run(self._execute_buffered, statement, params, **kwargs)
+        return result() if isinstance(result, FrozenResult) else result
+
+    async def scalar(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalar()
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await self._run(self.sync_session.get, entity, ident, **kwargs)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def delete(self, instance):
+        await self._run(self.sync_session.delete, instance)
+
+    async def refresh(self, instance, **kwargs):
+        await self._run(self.sync_session.refresh, instance, **kwargs)
+
+    async def commit(self):
+        await self._run(self.sync_session.commit)
+
+    async def rollback(self):
+        await self._run(self.sync_session.rollback)
+
+    async def close(self):
+        if not self._holds_slot:
+            # Never touched the database, so there is no connection to return
+            self.sync_session.close()
+            return
+
+        try:
+            await self._run(self.sync_session.close)
+        finally:
+            self._holds_slot = False
+            _session_slots.release()
+
+
+DBSession = Union["AsyncSession", ThreadedSession]
+
+
+# Dependency to get DB session
+async def get_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+
+    session = ThreadedSession(SessionLocal())
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+# The same session outside a request, e.g. once a stream has finished
+session_scope = asynccontextmanager(get_db)
+
+
+def upsert(entity):
+    """INSERT construct with ON CONFLICT support for the configured database"""
+    if engine.dialect.name == "sqlite":
+        return sqlite.insert(entity)
+    return postgresql.insert(entity)
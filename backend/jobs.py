@@ -0,0 +1,180 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import and_, delete, or_, select, update
+from database import DBSession
+from models import ChatJob
+from schema import ChatRequest
+
+# Seconds a claim lasts; a running worker renews it, a dead one lets it lapse
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))
+# Claims per job before a job whose workers keep dying is failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds finished jobs are kept for GET /jobs/{id}
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+# Seconds between checks of a job's status for GET /jobs/{id}/events
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", "0.5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# One claim at a time per process. Claims racing in the DB thread pool
+# could otherwise fill it with sessions waiting on SQLite's write lock,
+# leaving none free to commit the claim that holds it.
+_claiming = asyncio.Lock()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _runnable(now: datetime):
+    """Queued jobs, and running jobs whose worker stopped renewing its claim"""
+    return or_(
+        ChatJob.status == QUEUED,
+        and_(ChatJob.status == RUNNING, ChatJob.locked_until < now),
+    )
+
+
+async def submit_job(db: DBSession, user_id: str, data: ChatRequest) -> ChatJob:
+    job = ChatJob(
+        user_id=user_id,
+        status=QUEUED,
+        request=data.model_dump_json(),
+        attempts=0,
+        created_at=_now(),
+    )
+    db.add(job)
+    await db.commit()
+    return job
+
+
+async def get_job(db: DBSession, user_id: str, job_id: uuid.UUID) -> Optional[ChatJob]:
+    """The job, or None if the user does not own it"""
+    return await db.scalar(
+        select(ChatJob).where(ChatJob.id == job_id, ChatJob.user_id == user_id)
+    )
+
+
+async def claim_job(db: DBSession, lease: float = JOB_LEASE) -> Optional[ChatJob]:
+    """
+    Mark the oldest runnable job as running and return it, or None.
+
+    A single UPDATE ... RETURNING picks and claims the job, so two workers
+    never get the same one: Postgres skips rows another claim has locked,
+    and SQLite runs one write at a time.
+    """
+    async with _claiming:
+        return await _claim(db, lease)
+
+
+async def _claim(db: DBSession, lease: float) -> Optional[ChatJob]:
+    now = _now()
+    candidate = (
+        select(ChatJob.id)
+        .where(_runnable(now), ChatJob.attempts < JOB_MAX_ATTEMPTS)
+        .order_by(ChatJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    job = await db.scalar(
+        update(ChatJob)
+        .where(ChatJob.id == candidate, _runnable(now))
+        .values(
+            status=RUNNING,
+            attempts=ChatJob.attempts + 1,
+            started_at=now,
+            locked_until=now + timedelta(seconds=lease),
+        )
+        .returning(ChatJob)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return job
+
+
+def _claimed(job: ChatJob):
+    # A claim that lapsed and was taken over has a higher attempt count
+    return and_(
+        ChatJob.id == job.id, ChatJob.status == RUNNING, ChatJob.attempts == job.attempts
+    )
+
+
+async def renew_claim(db: DBSession, job: ChatJob, lease: float = JOB_LEASE) -> bool:
+    """Extend the claim; False if another worker has taken the job over"""
+    result = await db.execute(
+        update(ChatJob)
+        .where(_claimed(job))
+        .values(locked_until=_now() + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def finish_job(
+    db: DBSession,
+    job: ChatJob,
+    response: Optional[str] = None,
+    conversation_id: Optional[uuid.UUID] = None,
+    error: Optional[str] = None,
+    error_status: Optional[int] = None,
+) -> bool:
+    """Store the outcome; False if another worker has taken the job over"""
+    result = await db.execute(
+        update(ChatJob)
+        .where(_claimed(job))
+        .values(
+            status=FAILED if error is not None else SUCCEEDED,
+            response=response,
+            conversation_id=conversation_id,
+            error=error,
+            error_status=error_status,
+            locked_until=None,
+            finished_at=_now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def sweep_jobs(db: DBSession, retention: float = JOB_RETENTION) -> int:
+    """
+    Fail jobs that used up their claims, and delete old finished jobs.
+
+    Returns how many jobs were failed.
+    """
+    now = _now()
+    abandoned = await db.execute(
+        update(ChatJob)
+        .where(
+            ChatJob.status == RUNNING,
+            ChatJob.locked_until < now,
+            ChatJob.attempts >= JOB_MAX_ATTEMPTS,
+        )
+        .values(
+            status=FAILED,
+            error="Job was abandoned by its workers",
+            error_status=500,
+            locked_until=None,
+            finished_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        delete(ChatJob)
+        .where(
+            ChatJob.status.in_(FINISHED),
+            ChatJob.finished_at < now - timedelta(seconds=retention),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return abandoned.rowcount
@@ -1,21 +1,70 @@
-from fastapi import FastAPI, Depends, Security, Path, Request, Response, APIRouter
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, Header, Path, Request, Response, APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import case, or_, select
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-from database import SessionLocal, engine
-from models import Base, User, UserAiModels, UserSelectedAiModel
-from supabase import validate_supabase_token
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import conversations
+import model_resolver
+import supabase
+from uuid import UUID
+from chat import (
+    ChatRequestError,
+    chat_cache_key,
+    chat_messages,
+    chat_reply,
+    check_chat_request,
+)
+from database import DBSession, engine, get_db, session_scope, upsert
+from metrics import MetricsMiddleware, registry
+from migrations import AUTO_MIGRATE, upgrade
+from jobs import FAILED, FINISHED, JOB_EVENTS_INTERVAL, get_job, submit_job
+from logging_config import configure_logging
+from models import Conversation, User, UserAiModels, UserSelectedAiModel
+from middleware.auth import InvalidTokenError, get_current_user
+from model_resolver import resolve_selected_model, invalidate_selected_model
+from conversations import (
+    ConversationConflict,
+    append_messages,
+    create_conversation,
+    delete_conversation,
+    load_history,
+)
+from response_cache import response_cache
+from shared_cache import close_shared_tier
+from resumable import STREAM_RESUME, close_streams, get_stream, resume_stats, start_stream
+from streaming import (
+    EventStreamResponse,
+    coalesce_chunks,
+    format_sse,
+    read_ahead,
+    stream_stats,
+)
 from schema import (
     CreateModelRequest,
     ModelResponse,
     UserSelectedAiModelResponse,
     SelectModelRequest,
     ChatRequest,
+    ChatBatchRequest,
     ChatMessage,
+    CreateConversationRequest,
+    ConversationResponse,
+    ConversationDetailResponse,
+    JobResponse,
 )
 from ai_providers.ai_service import ai_service
+from ai_providers.errors import ProviderError
+from ai_providers.http_client import close_http_client
+from ai_providers.providers import ProviderRegistry
+
+# Largest POST /chat/batch, and how many of its prompts run at once
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+configure_logging()
 
 app = FastAPI()
 app.add_middleware(
@@ -24,20 +73,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the id they reconnect to a stream with
+    expose_headers=["X-Stream-Id"],
 )
-security = HTTPBearer()
+app.add_middleware(MetricsMiddleware)
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
 
+@app.exception_handler(InvalidTokenError)
+async def invalid_token_handler(request: Request, exc: InvalidTokenError):
+    return JSONResponse(
+        status_code=401, content={"success": False, "error": "Invalid token"}
+    )
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+@app.exception_handler(ChatRequestError)
+async def chat_request_error_handler(request: Request, exc: ChatRequestError):
+    return JSONResponse(
+        status_code=exc.status_code, content={"success": False, "error": exc.error}
+    )
+
+
+@app.exception_handler(ConversationConflict)
+async def conversation_conflict_handler(request: Request, exc: ConversationConflict):
+    return JSONResponse(
+        status_code=409,
+        content={"success": False, "error": "Conversation was modified concurrently"},
+    )
+
+
+@app.on_event("startup")
+async def apply_migrations():
+    # Opt-in: inspecting every table would slow each cold start
+    if AUTO_MIGRATE:
+        await asyncio.to_thread(upgrade)
+
+
+@app.on_event("shutdown")
+async def close_provider_connections():
+    await close_streams()
+    await ProviderRegistry.clear_pool()
+    await close_http_client()
+    await close_shared_tier()
 
 
 @app.get("/")
@@ -47,25 +123,19 @@ def root():
 
 @app.post("/sync")
 async def sync_user(
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
     email = user_data.get("email")
 
-    # Check if user exists, else create
-    existing_user = db.query(User).filter(User.id == user_id).first()
-    if not existing_user:
-        new_user = User(id=user_id, email=email)
-        db.add(new_user)
-        db.commit()
+    # Create the user unless it already exists, in one round trip
+    await db.execute(
+        upsert(User)
+        .values(id=user_id, email=email)
+        .on_conflict_do_nothing(index_elements=[User.id])
+    )
+    await db.commit()
 
     return {"success": True}
 
@@ -73,69 +143,51 @@ async def sync_user(
 @app.post("/ai-models", response_model=ModelResponse)
 async def create_model(
     data: CreateModelRequest,
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
 
-    # Check if model with same model_id exists for the user
-    existing_model = (
-        db.query(UserAiModels)
-        .filter(UserAiModels.user_id == user_id, UserAiModels.model_id == data.model_id)
-        .first()
-    )
-
-    if existing_model:
-        # Check if model or api_key changed
-        if existing_model.model != data.model or existing_model.api_key != data.api_key:
-            # Update existing model details
-            existing_model.model = data.model
-            existing_model.api_key = data.api_key
-            existing_model.name = data.name  # optionally update the name too
-            db.commit()
-            db.refresh(existing_model)
-
-        # Return existing or updated model
-        return existing_model
-
-    # No existing model found, create a new one
-    new_model = UserAiModels(
+    # Insert the model, or update the user's existing entry for this model_id
+    insert = upsert(UserAiModels).values(
         user_id=user_id,
         model_id=data.model_id,
         name=data.name,
         model=data.model,
         api_key=data.api_key,
     )
+    # The name is only updated alongside a model or api_key change
+    changed = or_(
+        UserAiModels.model != insert.excluded.model,
+        UserAiModels.api_key != insert.excluded.api_key,
+    )
+    stmt = insert.on_conflict_do_update(
+        index_elements=[UserAiModels.user_id, UserAiModels.model_id],
+        set_={
+            "model": insert.excluded.model,
+            "api_key": insert.excluded.api_key,
+            "name": case((changed, insert.excluded.name), else_=UserAiModels.name),
+        },
+    ).returning(UserAiModels)
+
+    result = await db.execute(stmt, execution_options={"populate_existing": True})
+    model_entry = result.scalar_one()
+    await db.commit()
+    await invalidate_selected_model(user_id)
 
-    db.add(new_model)
-    db.commit()
-    db.refresh(new_model)
-
-    return new_model
+    return model_entry
 
 
 @app.get("/ai-models", response_model=list[ModelResponse])
 async def get_user_models(
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
-    models = db.query(UserAiModels).filter(UserAiModels.user_id == user_id).all()
-    return models
+    models = await db.scalars(
+        select(UserAiModels).where(UserAiModels.user_id == user_id)
+    )
+    return models.all()
 
 
 from fastapi import Path
@@ -152,21 +204,14 @@ class UpdateModelRequest(BaseModel):
 async def update_model(
     model_id: str = Path(...),
     data: UpdateModelRequest = None,
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
-    model_entry = (
-        db.query(UserAiModels)
-        .filter(UserAiModels.user_id == user_id, UserAiModels.model_id == model_id)
-        .first()
+    model_entry = await db.scalar(
+        select(UserAiModels).where(
+            UserAiModels.user_id == user_id, UserAiModels.model_id == model_id
+        )
     )
 
     if not model_entry:
@@ -181,30 +226,23 @@ async def update_model(
     if data.api_key is not None:
         model_entry.api_key = data.api_key
 
-    db.commit()
-    db.refresh(model_entry)
+    await db.commit()
+    await invalidate_selected_model(user_id)
     return model_entry
 
 
 @app.delete("/models/{id}")
 async def delete_model(
     id: str = Path(...),
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
 
-    model_entry = (
-        db.query(UserAiModels)
-        .filter(UserAiModels.id == id, UserAiModels.user_id == user_id)
-        .first()
+    model_entry = await db.scalar(
+        select(UserAiModels).where(
+            UserAiModels.id == id, UserAiModels.user_id == user_id
+        )
     )
 
     if not model_entry:
@@ -213,8 +251,9 @@ async def delete_model(
             content={"success": False, "error": "Model not found or access denied"},
         )
 
-    db.delete(model_entry)
-    db.commit()
+    await db.delete(model_entry)
+    await db.commit()
+    await invalidate_selected_model(user_id)
 
     return {"success": True, "message": "Model deleted successfully"}
 
@@ -222,81 +261,49 @@ async def delete_model(
 @app.put("/models/selected", response_model=UserSelectedAiModelResponse)
 async def set_selected_model(
     data: SelectModelRequest,
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
 
-    existing_selection = (
-        db.query(UserSelectedAiModel)
-        .filter(UserSelectedAiModel.user_id == user_id)
-        .first()
+    insert = upsert(UserSelectedAiModel).values(
+        user_id=user_id, model_id=data.model_id
     )
+    stmt = insert.on_conflict_do_update(
+        index_elements=[UserSelectedAiModel.user_id],
+        set_={"model_id": insert.excluded.model_id},
+    ).returning(UserSelectedAiModel)
 
-    if existing_selection:
-        existing_selection.model_id = data.model_id
-        db.commit()
-        db.refresh(existing_selection)
-        return existing_selection
-
-    new_selection = UserSelectedAiModel(user_id=user_id, model_id=data.model_id)
-
-    db.add(new_selection)
-    db.commit()
-    db.refresh(new_selection)
+    result = await db.execute(stmt, execution_options={"populate_existing": True})
+    selection = result.scalar_one()
+    await db.commit()
+    await invalidate_selected_model(user_id)
 
-    return new_selection
+    return selection
 
 
 @app.get("/models/selected/details", response_model=ModelResponse)
 async def get_selected_model_details(
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
 
-    # Step 1: Fetch the selected model_id
-    selection = (
-        db.query(UserSelectedAiModel)
-        .filter(UserSelectedAiModel.user_id == user_id)
-        .first()
-    )
+    # Selection and model details in one joined (cached) lookup
+    selected = await resolve_selected_model(db, user_id)
 
-    if not selection:
+    if not selected:
         return JSONResponse(
             status_code=404,
             content={"success": False, "error": "No selected model found"},
         )
 
-    # Step 2: Fetch full model details
-    model_entry = (
-        db.query(UserAiModels)
-        .filter(
-            UserAiModels.user_id == user_id, UserAiModels.model_id == selection.model_id
-        )
-        .first()
-    )
-
-    if not model_entry:
+    if not selected.found:
         return JSONResponse(
             status_code=404, content={"success": False, "error": "Model not found"}
         )
 
-    return model_entry
+    return selected
 
 
 @app.get("/ai-providers")
@@ -306,6 +313,217 @@ async def get_available_providers():
     return {"success": True, "providers": providers}
 
 
+@app.get("/streams/stats")
+async def get_stream_stats():
+    """Counters for active, completed and client-cancelled SSE streams"""
+    return {
+        "success": True,
+        "streams": stream_stats.snapshot(),
+        "resumable": resume_stats.snapshot(),
+    }
+
+
+@app.post("/conversations", response_model=ConversationResponse)
+async def start_conversation(
+    data: CreateConversationRequest,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    return await create_conversation(db, user_data["sub"], data.title)
+
+
+@app.get("/conversations", response_model=list[ConversationResponse])
+async def get_conversations(
+    limit: int = 50,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    conversations = await db.scalars(
+        select(Conversation)
+        .where(Conversation.user_id == user_data["sub"])
+        .order_by(Conversation.updated_at.desc())
+        .limit(min(limit, 200))
+    )
+    return conversations.all()
+
+
+@app.get("/conversations/{conversation_id}", response_model=ConversationDetailResponse)
+async def get_conversation(
+    conversation_id: UUID = Path(...),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    user_id = user_data["sub"]
+    history = await load_history(db, user_id, conversation_id)
+    if history is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Conversation not found"}
+        )
+
+    conversation = await db.get(Conversation, conversation_id)
+    return {
+        "id": conversation.id,
+        "title": conversation.title,
+        "message_count": conversation.message_count,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "messages": history.messages[: conversation.message_count],
+    }
+
+
+@app.delete("/conversations/{conversation_id}")
+async def remove_conversation(
+    conversation_id: UUID = Path(...),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    if not await delete_conversation(db, user_data["sub"], conversation_id):
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Conversation not found"}
+        )
+    return {"success": True, "message": "Conversation deleted successfully"}
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Response cache hits and misses, and requests merged by single-flight"""
+    if response_cache is None:
+        cache_stats = {"enabled": False}
+    else:
+        cache_stats = {"enabled": True, **response_cache.stats()}
+    return {
+        "success": True,
+        "response_cache": cache_stats,
+        "single_flight": ai_service.flights.stats(),
+    }
+
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Upstream calls running and queued, how long requests waited, and retries"""
+    return {
+        "success": True,
+        "scheduler": ai_service.scheduler.stats(),
+        "resilience": ai_service.resilience.stats(),
+    }
+
+
+@registry.collector("sse_streams_active", "gauge", "SSE responses being written")
+def _active_streams():
+    return [({}, stream_stats.active)]
+
+
+@registry.collector(
+    "sse_streams_total", "counter", "Finished SSE responses by how they ended", ("outcome",)
+)
+def _finished_streams():
+    return [
+        ({"outcome": "completed"}, stream_stats.completed),
+        ({"outcome": "cancelled"}, stream_stats.cancelled),
+    ]
+
+
+@registry.collector("sse_streams_generating", "gauge", "Resumable streams still generating")
+def _generating_streams():
+    return [({}, resume_stats.snapshot()["running"])]
+
+
+@registry.collector(
+    "sse_stream_resumes_total",
+    "counter",
+    "Reconnects to resumable streams, and streams dropped unresumed",
+    ("outcome",),
+)
+def _stream_resumes():
+    return [
+        ({"outcome": "resumed"}, resume_stats.resumed),
+        ({"outcome": "expired"}, resume_stats.expired),
+        ({"outcome": "abandoned"}, resume_stats.abandoned),
+    ]
+
+
+@registry.collector("stream_buffered_bytes", "gauge", "Chunks held in stream read-ahead buffers")
+def _buffered_bytes():
+    return [({}, stream_stats.snapshot()["buffered_bytes"])]
+
+
+@registry.collector(
+    "scheduler_calls", "gauge", "Upstream calls holding or waiting for a slot", ("state",)
+)
+def _scheduler_calls():
+    stats = ai_service.scheduler.stats()
+    return [({"state": "running"}, stats["running"]), ({"state": "waiting"}, stats["waiting"])]
+
+
+@registry.collector(
+    "scheduler_rejected_total", "counter", "Calls rejected after waiting too long for a slot"
+)
+def _scheduler_rejected():
+    return [({}, ai_service.scheduler.stats()["rejected"])]
+
+
+@registry.collector("single_flight_in_flight", "gauge", "Upstream generations being shared")
+def _flights_in_flight():
+    return [({}, ai_service.flights.stats()["in_flight"])]
+
+
+@registry.collector(
+    "single_flight_joined_total", "counter", "Requests served by another request's generation"
+)
+def _flights_joined():
+    return [({}, ai_service.flights.stats()["joined"])]
+
+
+@registry.collector(
+    "provider_resilience_total", "counter", "Retries, timeouts and hedged attempts", ("event",)
+)
+def _resilience_events():
+    stats = ai_service.resilience.stats()
+    return [({"event": event}, stats[event]) for event in ("retried", "timeouts", "hedged", "hedge_wins")]
+
+
+def _cache_stats():
+    caches = {
+        "token": supabase._verified_tokens.stats(),
+        "selected_model": model_resolver._selected_model_cache.stats(),
+        "conversation_history": conversations._history_cache.stats(),
+    }
+    if response_cache is not None:
+        caches["response"] = response_cache.stats()
+    return caches
+
+
+@registry.collector("cache_hits_total", "counter", "Cache lookups that found an entry", ("cache",))
+def _cache_hits():
+    return [({"cache": name}, stats["hits"]) for name, stats in _cache_stats().items()]
+
+
+@registry.collector("cache_misses_total", "counter", "Cache lookups that found nothing", ("cache",))
+def _cache_misses():
+    return [({"cache": name}, stats["misses"]) for name, stats in _cache_stats().items()]
+
+
+@registry.collector("cache_entries", "gauge", "Entries held in in-process caches", ("cache",))
+def _cache_entries():
+    return [
+        ({"cache": name}, stats["size"])
+        for name, stats in _cache_stats().items()
+        if "size" in stats
+    ]
+
+
+@registry.collector("db_pool_checked_out", "gauge", "Database connections in use")
+def _db_connections():
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return [({}, checkedout())] if callable(checkedout) else []
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """All metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # Assuming chatService is imported and has a non-streaming helper (or you wrap your streaming call to accumulate)
 
 
@@ -313,39 +531,19 @@ async def get_available_providers():
 async def chat_endpoint_non_stream(
     request: Request,
     data: ChatRequest,
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
-
     user_id = user_data["sub"]
 
-    selection = (
-        db.query(UserSelectedAiModel)
-        .filter(UserSelectedAiModel.user_id == user_id)
-        .first()
-    )
-    if not selection:
+    selected = await resolve_selected_model(db, user_id)
+    if not selected:
         return JSONResponse(
             status_code=404,
             content={"success": False, "error": "No selected model found"},
         )
 
-    model_entry = (
-        db.query(UserAiModels)
-        .filter(
-            UserAiModels.user_id == user_id,
-            UserAiModels.model_id == selection.model_id,
-        )
-        .first()
-    )
-    print("model_entry details:", model_entry)
-    if not model_entry or not model_entry.api_key:
+    if not selected.found or not selected.api_key:
         return JSONResponse(
             status_code=400,
             content={
@@ -355,18 +553,15 @@ async def chat_endpoint_non_stream(
         )
 
     try:
-        # Convert messages to dict format
-        messages = [{"role": msg.role, "content": msg.content} for msg in data.messages]
-
-        # Generate response using AI service
-        response = await ai_service.generate_response(
-            messages,
-            model_entry.model_id,  # provider_id (e.g., "gemini")
-            model_entry.api_key,
-            model_entry.model,  # model name
-        )
+        return await chat_reply(db, user_id, selected, data)
 
-        return {"success": True, "response": response}
+    except (ChatRequestError, ConversationConflict):
+        raise
+
+    except ProviderError as e:
+        return JSONResponse(
+            status_code=e.status_code, content={"success": False, "error": str(e)}
+        )
 
     except Exception as e:
         return JSONResponse(
@@ -374,51 +569,69 @@ async def chat_endpoint_non_stream(
         )
 
 
-@app.post("/chats")
-async def chat_endpoint_stream(
-    request: Request,
-    response: Response,
-    data: ChatRequest,
-    credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+async def _as_completed(
+    items: list, worker: Callable[[int, object], Awaitable[dict]], concurrency: int
+) -> AsyncIterator[dict]:
+    """
+    Run `worker(index, item)` for every item, at most `concurrency` at a time.
+
+    Results are yielded in the order they finish. Closing the iterator
+    cancels the work still running.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def run():
+        for index, item in pending:
+            results.put_nowait(await worker(index, item))
+
+    workers = [asyncio.create_task(run()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in items:
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+@app.post("/chat/batch")
+async def chat_batch(
+    data: ChatBatchRequest,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
 ):
-    token = credentials.credentials
-    user_data = await validate_supabase_token(token)
-    if not user_data:
-        return JSONResponse(
-            status_code=401, content={"success": False, "error": "Invalid token"}
-        )
+    """
+    Answer many independent chat requests in one call.
 
+    The token and the selected model are resolved once for the whole batch,
+    and every prompt shares the pooled provider instance. A failed prompt
+    gets an error entry; the rest of the batch still runs.
+    """
     user_id = user_data["sub"]
 
-    # Fetch user's selected AI model
-    selection = (
-        db.query(UserSelectedAiModel)
-        .filter(UserSelectedAiModel.user_id == user_id)
-        .first()
-    )
-    if not selection:
+    if len(data.requests) > CHAT_BATCH_MAX_ITEMS:
         return JSONResponse(
-            status_code=404,
-            content={"success": False, "error": "No selected model found"},
+            status_code=400,
+            content={
+                "success": False,
+                "error": f"At most {CHAT_BATCH_MAX_ITEMS} requests per batch",
+            },
         )
 
-    model_entry = (
-        db.query(UserAiModels)
-        .filter(
-            UserAiModels.user_id == user_id,
-            UserAiModels.model_id == selection.model_id,
+    selected = await resolve_selected_model(db, user_id)
+    if not selected:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": "No selected model found"},
         )
-        .first()
-    )
 
-    if not model_entry:
+    if not selected.found:
         return JSONResponse(
             status_code=404, content={"success": False, "error": "Model not found"}
         )
 
-    # Validate API key
-    if not model_entry.api_key:
+    if not selected.api_key:
         return JSONResponse(
             status_code=400,
             content={
@@ -427,43 +640,253 @@ async def chat_endpoint_stream(
             },
         )
 
-    # Convert messages to dict format
-    messages = [{"role": msg.role, "content": msg.content} for msg in data.messages]
+    # Items with a conversation_id open their own session when they run
+    await db.close()
+
+    async def answer(index: int, item: ChatRequest) -> dict:
+        try:
+            async with session_scope() as session:
+                result = await chat_reply(session, user_id, selected, item)
+        except ChatRequestError as e:
+            result = {"success": False, "status": e.status_code, "error": e.error}
+        except ConversationConflict:
+            result = {
+                "success": False,
+                "status": 409,
+                "error": "Conversation was modified concurrently",
+            }
+        except ProviderError as e:
+            result = {"success": False, "status": e.status_code, "error": str(e)}
+        except Exception as e:
+            result = {"success": False, "status": 500, "error": str(e)}
+        return {"index": index, **result}
+
+    concurrency = max(1, min(data.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY))
+    results = _as_completed(data.requests, answer, concurrency)
+
+    if data.stream:
+        async def lines():
+            try:
+                async for result in results:
+                    yield json.dumps(result) + "\n"
+            finally:
+                await results.aclose()
+
+        # Stops the remaining prompts if the client goes away
+        return EventStreamResponse(lines(), media_type="application/x-ndjson")
+
+    ordered = sorted([result async for result in results], key=lambda r: r["index"])
+    return {"success": True, "results": ordered}
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_chat_job(
+    data: ChatRequest,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Queue a chat request for a background worker (`python worker.py`).
 
-    # Create queue for streaming
-    queue = asyncio.Queue()
+    Returns at once with the job's id; GET /jobs/{id} or the event stream
+    at GET /jobs/{id}/events has the reply once a worker has answered.
+    """
+    check_chat_request(data)
+    return await submit_job(db, user_data["sub"], data)
 
-    # Callback to handle chunks from AI service
-    def on_chunk(chunk):
-        queue.put_nowait(chunk)
 
-    # Start AI streaming in background
-    async def start_ai_stream():
-        await ai_service.stream_chat(
-            messages,
-            model_entry.model_id,  # provider_id (e.g., "gemini")
-            model_entry.api_key,
-            model_entry.model,  # model name
-            on_chunk,
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_chat_job(
+    job_id: UUID,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    job = await get_job(db, user_data["sub"], job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Job not found"}
         )
+    return job
 
-    # Start the AI streaming task
-    asyncio.create_task(start_ai_stream())
 
-    # Event generator for SSE
+@app.get("/jobs/{job_id}/events")
+async def chat_job_events(
+    job_id: UUID,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Server-sent events for a job: a `status` event whenever its status
+    changes, then the reply as data followed by `done`, or an `error`.
+    """
+    user_id = user_data["sub"]
+    job = await get_job(db, user_id, job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Job not found"}
+        )
+    await db.close()
+
     async def event_generator():
+        current, status = job, None
         while True:
-            chunk = await queue.get()
-
-            if chunk.get("error"):
-                yield f"event: error\ndata: {chunk['error']}\n\n"
+            if current.status != status:
+                status = current.status
+                yield format_sse(status, event="status")
+            if status in FINISHED:
                 break
+            # Workers run in other processes, so the table is all we can watch
+            await asyncio.sleep(JOB_EVENTS_INTERVAL)
+            async with session_scope() as session:
+                current = await get_job(session, user_id, job_id)
+            if current is None:
+                yield format_sse("Job not found", event="error")
+                return
 
-            if chunk["isComplete"]:
-                yield "event: done\ndata: \n\n"
-                break
+        if status == FAILED:
+            yield format_sse(current.error or "", event="error")
+            return
+        yield format_sse(current.response or "")
+        yield format_sse("", event="done")
+
+    return EventStreamResponse(event_generator())
+
+
+@app.post("/chats")
+async def chat_endpoint_stream(
+    request: Request,
+    response: Response,
+    data: ChatRequest,
+    user_data: dict = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+):
+    user_id = user_data["sub"]
+
+    # Fetch user's selected AI model and its config in one lookup
+    selected = await resolve_selected_model(db, user_id)
+    if not selected:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": "No selected model found"},
+        )
 
-            # Send content chunks
-            yield f"data: {chunk['content']}\n\n"
+    if not selected.found:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Model not found"}
+        )
+
+    # Validate API key
+    if not selected.api_key:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": "API key is missing for the selected model",
+            },
+        )
+
+    messages, history, message = await chat_messages(db, user_id, data)
+    cache_key = chat_cache_key(selected, messages)
+
+    # Hand the connection back to the pool instead of holding it for the
+    # whole stream; the session's teardown only runs after the response
+    await db.close()
+
+    # Event generator for SSE. Tokens pass through a bounded read-ahead
+    # buffer, so a slow consumer eventually slows the upstream read instead
+    # of piling up in memory. Without STREAM_RESUME, EventStreamResponse
+    # cancels and closes it if the client disconnects.
+    async def event_generator():
+        reply = []
+        cached = await response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            # Replay the stored reply as one frame
+            reply.append(cached)
+            yield format_sse(cached)
+        else:
+            stream = None
+            try:
+                # Provider lookup happens here, so its failures get an error event too
+                chunks = ai_service.stream(
+                    messages,
+                    selected.model_id,  # provider_id (e.g., "gemini")
+                    selected.api_key,
+                    selected.model,  # model name
+                    conversation_id=history.id if history else None,
+                    user_id=user_id,
+                )
+                # Small chunks are merged into fewer frames (see SSE_FLUSH_*)
+                stream = coalesce_chunks(read_ahead(chunks))
+                async for text in stream:
+                    reply.append(text)
+                    # Send content chunks
+                    yield format_sse(text)
+            except Exception as e:
+                yield format_sse(f"Provider error: {str(e)}", event="error")
+                return
+            finally:
+                if stream is not None:
+                    await stream.aclose()
+
+            # Only complete replies are cached
+            if cache_key:
+                await response_cache.set(cache_key, "".join(reply))
+
+        # Only completed turns are stored in the conversation
+        if history is not None:
+            try:
+                async with session_scope() as session:
+                    await append_messages(
+                        session,
+                        history,
+                        [message, {"role": "assistant", "content": "".join(reply)}],
+                    )
+            except ConversationConflict:
+                yield format_sse("Conversation was modified concurrently", event="error")
+                return
+
+        yield format_sse("", event="done")
+
+    if not STREAM_RESUME:
+        return EventStreamResponse(event_generator())
+
+    # Generation runs on its own, so a client that drops can reconnect to
+    # GET /chats/{stream_id} instead of starting a second generation
+    stream = start_stream(user_id, event_generator())
+    return EventStreamResponse(stream.events(), headers={"X-Stream-Id": stream.id})
+
+
+@app.get("/chats/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None),
+    user_data: dict = Depends(get_current_user),
+):
+    """
+    Reconnect to a /chats stream, by the X-Stream-Id it was answered with.
+
+    Sends the events after Last-Event-ID (all kept events without it),
+    then the rest as they are generated. Streams are kept in the process
+    that started them, for STREAM_RESUME_TTL seconds after their last event.
+    """
+    stream = get_stream(stream_id, user_data["sub"])
+    if stream is None:
+        return JSONResponse(
+            status_code=404, content={"success": False, "error": "Stream not found"}
+        )
+
+    try:
+        after = int(last_event_id) if last_event_id else stream.first_id - 1
+    except ValueError:
+        return JSONResponse(
+            status_code=400, content={"success": False, "error": "Invalid Last-Event-ID"}
+        )
+    if not stream.can_resume(after):
+        resume_stats.expired += 1
+        return JSONResponse(
+            status_code=410,
+            content={"success": False, "error": "Stream events are no longer available"},
+        )
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    resume_stats.resumed += 1
+    return EventStreamResponse(stream.events(after), headers={"X-Stream-Id": stream.id})
@@ -0,0 +1,296 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; request latencies, and upstream first-token times
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Seconds; single SQL statements
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+# Output tokens per second of one upstream stream
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800)
+
+Labels = Tuple[str, ...]
+# (labels, value) pairs produced by a collector at scrape time
+Samples = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Observed from worker threads too (SQL timings)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    """Monotonic total, per label set"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Current value, per label set"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, per label set"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (plus +Inf), and the sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics in the Prometheus text exposition format.
+
+    Counters, gauges and histograms are updated as things happen.
+    Collectors are called at scrape time for values other modules already
+    keep (queue depths, cache hit counts), so those paths pay nothing.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, str, Sequence[str], Callable[[], Samples]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(
+        self, name: str, type: str, help: str, labelnames: Sequence[str] = ()
+    ) -> Callable[[Callable[[], Samples]], Callable[[], Samples]]:
+        """Decorator registering a function that yields (labels, value) samples"""
+        def decorator(fn: Callable[[], Samples]) -> Callable[[], Samples]:
+            self._collectors.append((name, type, help, tuple(labelnames), fn))
+            return fn
+        return decorator
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, type, help, labelnames, fn in self._collectors:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            for labels, value in fn():
+                key = tuple(str(labels.get(label, "")) for label in labelnames)
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from request to the end of the response body",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "http_requests_in_progress", "Requests being served, streams included", ("method",)
+)
+UPSTREAM_FIRST_TOKEN = registry.histogram(
+    "upstream_time_to_first_token_seconds",
+    "Time from starting an upstream stream to its first chunk",
+    ("provider", "model"),
+)
+UPSTREAM_DURATION = registry.histogram(
+    "upstream_request_duration_seconds",
+    "Time from starting an upstream call to its end",
+    ("provider", "model", "kind"),
+)
+UPSTREAM_TOKEN_RATE = registry.histogram(
+    "upstream_tokens_per_second",
+    "Estimated output tokens per second of a finished stream, after its first chunk",
+    ("provider", "model"),
+    RATE_BUCKETS,
+)
+UPSTREAM_TOKENS = registry.counter(
+    "upstream_tokens_total",
+    "Estimated tokens sent to and received from providers",
+    ("provider", "model", "direction"),
+)
+UPSTREAM_CALLS = registry.counter(
+    "upstream_requests_total",
+    "Upstream calls by how they ended",
+    ("provider", "model", "kind", "outcome"),
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ("operation",),
+    QUERY_BUCKETS,
+)
+
+
+def route_label(scope: dict) -> str:
+    """The matched route's path template, so IDs do not become labels"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request until its body is complete.
+
+    Plain ASGI rather than BaseHTTPMiddleware, which would buffer the
+    event streams and hide client disconnects from them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc(method=method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec(method=method)
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started,
+                method=method,
+                route=route_label(scope),
+                status=str(status),
+            )
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run through a (sync) SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # The statement failed, so after_cursor_execute never runs
+        stack = context.connection.info.get("query_started") if context.connection else None
+        if stack:
+            stack.pop()
+
@@ -0,0 +1 @@
+# Request middleware and auth dependencies
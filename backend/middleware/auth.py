@@ -1,15 +1,30 @@
-from fastapi import Request, HTTPException
-import os
-import jwt  # pyjwt
+from fastapi import Request, HTTPException, Security
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from supabase import validate_supabase_token
+
+security = HTTPBearer()
+
+
+class InvalidTokenError(Exception):
+    """Raised by `get_current_user`; the app renders it as a 401"""
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Security(security),
+) -> dict:
+    """FastAPI dependency returning the verified claims of the bearer token"""
+    user_data = await validate_supabase_token(credentials.credentials)
+    if not user_data or "sub" not in user_data:
+        raise InvalidTokenError()
+    return user_data
+
 
 async def verify_token(request: Request):
     token = request.headers.get("Authorization")
     if not token:
         raise HTTPException(status_code=401, detail="Missing token")
 
-    try:
-        jwt_token = token.split("Bearer ")[1]
-        payload = jwt.decode(jwt_token, options={"verify_signature": False})
-        request.state.user = payload["sub"]
-    except Exception as e:
+    payload = await validate_supabase_token(token.removeprefix("Bearer "))
+    if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Invalid token")
+    request.state.user = payload["sub"]
@@ -0,0 +1,83 @@
+"""
+Bring an existing database up to the current schema.
+
+`Base.metadata.create_all` only creates missing tables, so indexes and
+unique constraints added to existing tables are applied here. Safe to run
+repeatedly:
+
+    python migrations.py
+
+The app does not touch the schema on import, so run this before deploying.
+AUTO_MIGRATE=1 runs it at app startup instead, for local development.
+"""
+import logging
+import os
+from sqlalchemy import delete, literal_column, select
+from database import engine
+from models import Base, UserAiModels, UserSelectedAiModel
+
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def _recency(conn, table):
+    """An expression that orders the table's rows by when they were last written"""
+    for name in ("updated_at", "created_at"):
+        if name in table.c:
+            return table.c[name]
+    if conn.dialect.name == "sqlite":
+        # Replaced rows get a new rowid, so this is insertion order
+        return literal_column("rowid")
+    if conn.dialect.name == "postgresql":
+        # The transaction that last wrote the row
+        return literal_column("xmin::text::bigint")
+    return table.c.id
+
+
+def _drop_duplicates(conn, table, *key_columns):
+    """
+    Keep one row per key so a unique index can be built over it.
+
+    The most recently written row wins, e.g. a user's latest selection.
+    """
+    seen = set()
+    duplicate_ids = []
+    rows = conn.execute(
+        select(table.c.id, *key_columns).order_by(*key_columns, _recency(conn, table).desc())
+    )
+    for row in rows:
+        key = tuple(row[1:])
+        if key in seen:
+            duplicate_ids.append(row[0])
+        else:
+            seen.add(key)
+
+    if duplicate_ids:
+        conn.execute(delete(table).where(table.c.id.in_(duplicate_ids)))
+        logger.info(
+            "Removed %d duplicate rows from %s, keeping the latest per key",
+            len(duplicate_ids),
+            table.name,
+        )
+
+
+def upgrade(bind=engine):
+    Base.metadata.create_all(bind=bind)
+
+    with bind.begin() as conn:
+        models = UserAiModels.__table__
+        selections = UserSelectedAiModel.__table__
+
+        _drop_duplicates(conn, models, models.c.user_id, models.c.model_id)
+        _drop_duplicates(conn, selections, selections.c.user_id)
+
+        for table in (models, selections):
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    upgrade()
+    logger.info("Database is up to date")
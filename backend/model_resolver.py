@@ -0,0 +1,94 @@
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Optional
+from sqlalchemy import and_, select
+from database import DBSession
+from models import UserAiModels, UserSelectedAiModel
+from shared_cache import TwoLevelCache
+
+
+@dataclass(frozen=True)
+class SelectedModel:
+    """A user's selected model joined with its stored configuration.
+
+    `model_id` always comes from the selection; the remaining fields are
+    None when the selection points at a model the user no longer has.
+    """
+
+    model_id: str
+    id: Optional[uuid.UUID] = None
+    name: Optional[str] = None
+    model: Optional[str] = None
+    api_key: Optional[str] = None
+
+    @property
+    def found(self) -> bool:
+        return self.id is not None
+
+
+def _dump_selected(selected: SelectedModel) -> bytes:
+    return json.dumps({**asdict(selected), "id": str(selected.id)}).encode()
+
+
+def _load_selected(data: bytes) -> SelectedModel:
+    fields = json.loads(data)
+    return SelectedModel(**{**fields, "id": uuid.UUID(fields["id"])})
+
+
+# Resolved model configs per user, shared by every request in this process
+# and, with SHARED_CACHE_URL, by every worker
+_selected_model_cache = TwoLevelCache(
+    "selected_model",
+    maxsize=int(os.getenv("MODEL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("MODEL_CACHE_TTL", "60")),
+    dumps=_dump_selected,
+    loads=_load_selected,
+)
+
+
+async def resolve_selected_model(db: DBSession, user_id: str) -> Optional[SelectedModel]:
+    """
+    Fetch the user's active model config (provider, model name, key) with a
+    single joined query, served from the model cache when possible.
+
+    Returns:
+        The selected model, or None if the user has not selected one
+    """
+    cached = await _selected_model_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    result = await db.execute(
+        select(
+            UserSelectedAiModel.model_id,
+            UserAiModels.id,
+            UserAiModels.name,
+            UserAiModels.model,
+            UserAiModels.api_key,
+        )
+        .outerjoin(
+            UserAiModels,
+            and_(
+                UserAiModels.user_id == UserSelectedAiModel.user_id,
+                UserAiModels.model_id == UserSelectedAiModel.model_id,
+            ),
+        )
+        .where(UserSelectedAiModel.user_id == user_id)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    selected = SelectedModel(*row)
+    # Only complete configs are cached; misses stay cheap to recover from
+    if selected.found:
+        await _selected_model_cache.set(user_id, selected)
+    return selected
+
+
+async def invalidate_selected_model(user_id: str) -> None:
+    """Drop the cached config after the user's selection or models change"""
+    await _selected_model_cache.invalidate(user_id)
@@ -1,6 +1,7 @@
 import uuid
+from datetime import datetime, timezone
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, String, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
 from database import Base
 
 class User(Base):
@@ -11,6 +12,10 @@ class User(Base):
 
 class UserAiModels(Base):
     __tablename__ = "user_ai_models"
+    # Also serves user_id-only lookups through its leftmost column
+    __table_args__ = (
+        Index("ix_user_ai_models_user_id_model_id", "user_id", "model_id", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(Text, nullable=False)
@@ -21,6 +26,75 @@ class UserAiModels(Base):
 
 class UserSelectedAiModel(Base):
     __tablename__ = "user_selected_ai_model"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Text, nullable=False, unique=True, index=True)
+    model_id = Column(Text, nullable=False)
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Text, nullable=False)
+    title = Column(Text, nullable=True)
+    # Number of stored messages; also the next message's seq
+    message_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+
+class ConversationMessage(Base):
+    __tablename__ = "conversation_messages"
+    __table_args__ = (
+        Index("ix_conversation_messages_conversation_id_seq", "conversation_id", "seq", unique=True),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    conversation_id = Column(
+        UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False
+    )
+    seq = Column(Integer, nullable=False)
+    role = Column(Text, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+    __table_args__ = (
+        Index("ix_response_cache_last_used_at", "last_used_at"),
+    )
+
+    # sha256 of the canonical (provider, model, messages) payload
+    key = Column(String(64), primary_key=True)
+    response = Column(Text, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+
+class ChatJob(Base):
+    __tablename__ = "chat_jobs"
+    __table_args__ = (
+        # Workers claim the oldest runnable job
+        Index("ix_chat_jobs_status_created_at", "status", "created_at"),
+    )
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(Text, nullable=False)
-    model_id = Column(Text, nullable=False)
\ No newline at end of file
+    # queued -> running -> succeeded | failed
+    status = Column(String(16), nullable=False, default="queued")
+    # The submitted ChatRequest, as JSON
+    request = Column(Text, nullable=False)
+    response = Column(Text, nullable=True)
+    conversation_id = Column(UUID(as_uuid=True), nullable=True)
+    error = Column(Text, nullable=True)
+    # The status code POST /chat would have answered the failure with
+    error_status = Column(Integer, nullable=True)
+    # Claims so far; a worker that dies mid-job leaves its claim to expire
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=_utcnow)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, select, update
+from ai_providers.singleflight import request_key
+from cache import TTLCache
+from database import session_scope, upsert
+from models import ResponseCacheEntry
+from shared_cache import TwoLevelCache
+
+# Opt in with RESPONSE_CACHE=memory (this process), =database (shared by
+# every worker through the response_cache table) or =shared (this process
+# in front of SHARED_CACHE_URL)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "off").lower()
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+
+
+def response_cache_key(provider_id: str, model: str, messages: List[Dict[str, str]]) -> str:
+    """Canonical request hash; shared by every user sending the same prompt"""
+    return request_key(provider_id, model, messages)
+
+
+class MemoryResponseCache:
+    """Responses held in this process, evicting the least recently used"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, response: str) -> None:
+        self._entries.set(key, response)
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+class DatabaseResponseCache:
+    """
+    Responses in the response_cache table, shared across workers.
+
+    Hits refresh `last_used_at`; every `prune_every` writes, expired rows
+    and the least recently used rows beyond `maxsize` are deleted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, prune_every: int = 100):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        now = datetime.now(timezone.utc)
+        async with session_scope() as db:
+            response = await db.scalar(
+                select(ResponseCacheEntry.response).where(
+                    ResponseCacheEntry.key == key, ResponseCacheEntry.expires_at > now
+                )
+            )
+            if response is None:
+                self.misses += 1
+                return None
+
+            await db.execute(
+                update(ResponseCacheEntry)
+                .where(ResponseCacheEntry.key == key)
+                .values(last_used_at=now)
+            )
+            await db.commit()
+        self.hits += 1
+        return response
+
+    async def set(self, key: str, response: str) -> None:
+        now = datetime.now(timezone.utc)
+        insert = upsert(ResponseCacheEntry).values(
+            key=key,
+            response=response,
+            expires_at=now + timedelta(seconds=self.ttl),
+            last_used_at=now,
+        )
+        async with session_scope() as db:
+            await db.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[ResponseCacheEntry.key],
+                    set_={
+                        "response": insert.excluded.response,
+                        "expires_at": insert.excluded.expires_at,
+                        "last_used_at": insert.excluded.last_used_at,
+                    },
+                )
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                await self._prune(db, now)
+            await db.commit()
+
+    async def _prune(self, db, now: datetime) -> None:
+        await db.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.expires_at <= now))
+        stale = (
+            select(ResponseCacheEntry.key)
+            .order_by(ResponseCacheEntry.last_used_at.desc())
+            .offset(self.maxsize)
+        )
+        await db.execute(delete(ResponseCacheEntry).where(ResponseCacheEntry.key.in_(stale)))
+
+    def stats(self) -> dict:
+        return {"maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def _create_response_cache():
+    if RESPONSE_CACHE == "memory":
+        return MemoryResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+    if RESPONSE_CACHE == "database":
+        return DatabaseResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+    if RESPONSE_CACHE == "shared":
+        return TwoLevelCache("response", RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+    return None
+
+
+# None unless RESPONSE_CACHE is set
+response_cache = _create_response_cache()
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+from cache import TTLCache
+from ai_providers.buffer import memory_budget
+
+# Opt in: a resumable stream keeps generating for STREAM_RESUME_GRACE after
+# its client disconnects. Off, /chats streams are tied to their connection
+STREAM_RESUME = os.getenv("STREAM_RESUME", "0") == "1"
+# Bytes of the most recent frames each stream keeps for reconnecting clients,
+# counted against STREAM_MEMORY_BUDGET; generation waits for readers to catch
+# up rather than drop frames they have not seen
+STREAM_RESUME_BYTES = int(os.getenv("STREAM_RESUME_BYTES", str(128 * 1024)))
+# Seconds a stream stays resumable after its last event
+STREAM_RESUME_TTL = float(os.getenv("STREAM_RESUME_TTL", "120"))
+# Seconds generation keeps going with no client attached
+STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", "30"))
+STREAM_RESUME_STREAMS = int(os.getenv("STREAM_RESUME_STREAMS", "1000"))
+
+logger = logging.getLogger(__name__)
+
+_streams = TTLCache(maxsize=STREAM_RESUME_STREAMS, ttl=STREAM_RESUME_TTL)
+# Streams still generating, resumable or not
+_running: Set["ResumableStream"] = set()
+
+
+class ResumeStats:
+    """Process-wide counters for resumable streams"""
+
+    def __init__(self):
+        self.started = 0
+        self.resumed = 0
+        self.expired = 0
+        self.abandoned = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "streams": len(_streams),
+            "running": len(_running),
+            "started": self.started,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+        }
+
+
+resume_stats = ResumeStats()
+
+
+class ResumableStream:
+    """
+    An SSE stream generated in the background, independent of any one
+    connection.
+
+    Frames are numbered from 1 and the most recent ones, up to `max_bytes`,
+    are kept, so a client that drops can reconnect with the last id it saw
+    and get only what it missed while generation carried on. Generation
+    pauses once keeping a new frame would drop one an attached reader has
+    not seen, or one nobody has seen while no reader is attached, so slow
+    clients still slow the upstream read. With no client attached for
+    `grace` seconds, generation is cancelled. Kept frames are reserved from
+    the stream memory budget until the stream expires.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        frames: AsyncIterator[str],
+        max_bytes: int = STREAM_RESUME_BYTES,
+        grace: float = STREAM_RESUME_GRACE,
+    ):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.last_id = 0
+        self.done = False
+        self._frames: Deque[Tuple[int, str]] = deque()
+        self._bytes = 0
+        self._appended = asyncio.Event()
+        # Last id sent to each attached reader
+        self._readers: Dict[object, int] = {}
+        self._advanced = asyncio.Event()
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._task = asyncio.create_task(self._produce(frames))
+
+    @property
+    def first_id(self) -> int:
+        """Id of the oldest frame still kept"""
+        return self._frames[0][0] if self._frames else self.last_id + 1
+
+    def can_resume(self, after: int) -> bool:
+        """Whether every frame after id `after` is still available"""
+        return 0 <= after <= self.last_id and after + 1 >= self.first_id
+
+    async def _produce(self, frames: AsyncIterator[str]) -> None:
+        try:
+            async for frame in frames:
+                await self._append(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Stream %s failed", self.id)
+        finally:
+            self.done = True
+            _running.discard(self)
+            self._notify()
+            # Kept for resumes until the stream expires with it
+            asyncio.get_running_loop().call_later(STREAM_RESUME_TTL, self._release)
+            await frames.aclose()
+
+    def _unread(self) -> bool:
+        """Whether the oldest kept frame still has to reach a reader"""
+        if not self._readers:
+            return True
+        return min(self._readers.values()) < self._frames[0][0]
+
+    async def _append(self, frame: str) -> None:
+        while self._frames and self._bytes + len(frame) > self.max_bytes and self._unread():
+            self._advanced.clear()
+            await self._advanced.wait()
+
+        await memory_budget.reserve(len(frame), lambda: self._bytes)
+        self.last_id += 1
+        self._frames.append((self.last_id, frame))
+        self._bytes += len(frame)
+        # Always keep the newest frame, however large
+        while self._bytes > self.max_bytes and len(self._frames) > 1:
+            size = len(self._frames.popleft()[1])
+            self._bytes -= size
+            memory_budget.release(size)
+        self._notify()
+
+    def _release(self) -> None:
+        self._frames.clear()
+        memory_budget.release(self._bytes)
+        self._bytes = 0
+
+    def _notify(self) -> None:
+        self._appended.set()
+        self._appended = asyncio.Event()
+        # Expires STREAM_RESUME_TTL after its last event
+        _streams.set(self.id, self)
+
+    async def events(self, after: int = 0) -> AsyncIterator[str]:
+        """Frames after id `after`, each with its `id:` field, until the end"""
+        reader = object()
+        self._attach(reader, after)
+        try:
+            while True:
+                appended = self._appended
+                if after < self.last_id:
+                    if not self.can_resume(after):
+                        # A client that fell behind by more than is kept
+                        resume_stats.expired += 1
+                        yield "event: error\ndata: Stream events are no longer available\n\n"
+                        return
+                    start = after + 1 - self.first_id
+                    for frame_id, frame in list(self._frames)[start:]:
+                        yield f"id: {frame_id}\n{frame}"
+                        after = self._readers[reader] = frame_id
+                        self._advanced.set()
+                    continue
+                if self.done:
+                    return
+                await appended.wait()
+        finally:
+            self._detach(reader)
+
+    def _attach(self, reader: object, after: int) -> None:
+        self._readers[reader] = after
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def _detach(self, reader: object) -> None:
+        del self._readers[reader]
+        self._advanced.set()
+        if not self._readers and not self.done:
+            loop = asyncio.get_running_loop()
+            self._abandon_timer = loop.call_later(self.grace, self._abandon)
+
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if not self._readers and not self.done:
+            resume_stats.abandoned += 1
+            self._task.cancel()
+
+    async def aclose(self) -> None:
+        """Stop generating"""
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def start_stream(user_id: str, frames: AsyncIterator[str]) -> ResumableStream:
+    """Generate `frames` in the background as a resumable stream"""
+    stream = ResumableStream(user_id, frames)
+    _streams.set(stream.id, stream)
+    _running.add(stream)
+    resume_stats.started += 1
+    return stream
+
+
+def get_stream(stream_id: str, user_id: str) -> Optional[ResumableStream]:
+    """The user's stream, if it is still kept"""
+    stream = _streams.get(stream_id)
+    if stream is None or stream.user_id != user_id:
+        return None
+    return stream
+
+
+async def close_streams() -> None:
+    """Stop every stream still generating, e.g. at shutdown"""
+    await asyncio.gather(*(stream.aclose() for stream in list(_running)))
+    _streams.clear()
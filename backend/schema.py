@@ -1,5 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from uuid import UUID 
 class CreateModelRequest(BaseModel):
     model_id: str
@@ -29,4 +30,44 @@ class ChatMessage(BaseModel):
     content: str
 
 class ChatRequest(BaseModel):
+    # Full history, for clients that keep it themselves
+    messages: List[ChatMessage] = []
+    # Or: a stored conversation plus only the new message
+    conversation_id: Optional[UUID] = None
+    message: Optional[ChatMessage] = None
+
+class ChatBatchRequest(BaseModel):
+    # Independent prompts, answered with the user's selected model
+    requests: List[ChatRequest]
+    # Upstream calls at once; capped by CHAT_BATCH_CONCURRENCY
+    concurrency: Optional[int] = None
+    # NDJSON lines as items finish, instead of one JSON body at the end
+    stream: bool = False
+
+class CreateConversationRequest(BaseModel):
+    title: Optional[str] = None
+
+class ConversationResponse(BaseModel):
+    id: UUID
+    title: Optional[str]
+    message_count: int
+    created_at: datetime
+    updated_at: datetime
+    class Config:
+        orm_mode = True
+
+class ConversationDetailResponse(ConversationResponse):
     messages: List[ChatMessage]
+
+class JobResponse(BaseModel):
+    id: UUID
+    status: str
+    response: Optional[str]
+    conversation_id: Optional[UUID]
+    error: Optional[str]
+    error_status: Optional[int]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    class Config:
+        orm_mode = True
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional
+from cache import TTLCache
+
+# Where caches are shared between workers: redis://host:6379/0 (any server
+# speaking the Redis protocol; needs the redis package), sqlite:///path for
+# workers on one host, or empty to keep every cache in its own process
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+# Namespaces keys when several deployments share one server
+SHARED_CACHE_PREFIX = os.getenv("SHARED_CACHE_PREFIX", "stepper:")
+# Seconds between checks for other workers' invalidations; a local entry
+# can outlive its invalidation elsewhere by this long
+SHARED_CACHE_SYNC_INTERVAL = float(os.getenv("SHARED_CACHE_SYNC_INTERVAL", "1"))
+# Seconds an invalidation stays in the log for workers that have not seen it
+SHARED_CACHE_LOG_TTL = float(os.getenv("SHARED_CACHE_LOG_TTL", "300"))
+# A worker further behind than this clears its local tier instead of catching up
+SHARED_CACHE_MAX_LOG_READ = 256
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RedisTier:
+    """The shared tier on a Redis-protocol server"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "SHARED_CACHE_URL names a Redis server but redis is not installed"
+            ) from e
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self._client.mget(keys)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class SQLiteTier:
+    """
+    The shared tier in a SQLite file, for workers on one host and tests.
+
+    Each thread keeps its own connection and WAL mode lets readers run
+    while another worker writes. Expired rows are deleted every
+    `prune_every` writes.
+    """
+
+    def __init__(self, path: str, prune_every: int = 1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _get(self, keys: List[str]) -> List[Optional[bytes]]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (*keys, time.time()),
+        )
+        found = dict(rows.fetchall())
+        return [found.get(key) for key in keys]
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def _delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _incr(self, key: str) -> int:
+        row = self._connection().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, 1, NULL) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1 RETURNING value",
+            (key,),
+        ).fetchone()
+        return row[0]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await asyncio.to_thread(self._get, [key]))[0]
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await asyncio.to_thread(self._get, keys)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def incr(self, key: str) -> int:
+        return await asyncio.to_thread(self._incr, key)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_shared_tier(url: str = SHARED_CACHE_URL):
+    """The shared tier `url` names, or None for process-local caches"""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteTier(url[len("sqlite:///"):])
+    return RedisTier(url)
+
+
+shared_tier = create_shared_tier()
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class TwoLevelCache:
+    """
+    A process-local LRU in front of an optional shared tier.
+
+    Reads try this process first, then the shared tier, and keep shared
+    hits locally for the rest of their TTL. Writes go to both tiers.
+    `invalidate` also bumps a version counter in the shared tier and logs
+    the key under it; every worker checks the counter at most every
+    SHARED_CACHE_SYNC_INTERVAL seconds and drops the keys invalidated since
+    it last looked. If the shared tier fails, the local tier carries on.
+
+    Keys are strings. Values cross the shared tier as `dumps`/`loads`
+    bytes, JSON by default.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        shared=_MISSING,
+        dumps: Callable[[Any], bytes] = _dumps,
+        loads: Callable[[bytes], Any] = json.loads,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared_tier if shared is _MISSING else shared
+        self.dumps = dumps
+        self.loads = loads
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self._prefix = f"{SHARED_CACHE_PREFIX}{name}:"
+        # Last invalidation this process has applied
+        self._version: Optional[int] = None
+        self._synced_at = float("-inf")
+        self._warned_at = float("-inf")
+
+    def _shared_key(self, key: str) -> str:
+        return self._prefix + key
+
+    def _log_key(self, version: int) -> str:
+        return f"{self._prefix}#invalidated:{version}"
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        self.shared_errors += 1
+        now = time.monotonic()
+        if now - self._warned_at > 60:
+            self._warned_at = now
+            logger.warning("Shared cache %s failed for %s: %s", operation, self.name, error)
+
+    async def _sync(self) -> None:
+        """Drop local entries other workers have invalidated"""
+        now = time.monotonic()
+        if now - self._synced_at < SHARED_CACHE_SYNC_INTERVAL:
+            return
+        self._synced_at = now
+
+        try:
+            version = int(await self.shared.get(self._log_key(0)) or 0)
+            seen = self._version
+            if seen is None or version < seen or version - seen > SHARED_CACHE_MAX_LOG_READ:
+                # First look, a reset server, or too far behind
+                self.local.clear()
+            elif version > seen:
+                keys = await self.shared.mget(
+                    [self._log_key(v) for v in range(seen + 1, version + 1)]
+                )
+                if None in keys:
+                    # Some already left the log
+                    self.local.clear()
+                else:
+                    for key in keys:
+                        self.local.delete(key.decode())
+            self._version = version
+        except Exception as e:
+            self._failed("sync", e)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        if self.shared is None:
+            return self.local.get(key, default)
+
+        await self._sync()
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        try:
+            data = await self.shared.get(self._shared_key(key))
+        except Exception as e:
+            self._failed("get", e)
+            return default
+        if data is None:
+            return default
+
+        expires_at, _, payload = data.partition(b"|")
+        ttl = float(expires_at) - time.time()
+        if ttl <= 0:
+            return default
+        value = self.loads(payload)
+        self.shared_hits += 1
+        self.local.set(key, value, ttl=min(ttl, self.ttl))
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store in both tiers; `ttl` overrides the default for this entry"""
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=ttl)
+        if self.shared is None or ttl <= 0:
+            return
+
+        # Entries carry their expiry so local copies never outlive it
+        data = b"%.3f|" % (time.time() + ttl) + self.dumps(value)
+        try:
+            await self.shared.set(self._shared_key(key), data, ttl)
+        except Exception as e:
+            self._failed("set", e)
+
+    async def invalidate(self, key: str) -> None:
+        """Drop the entry here, in the shared tier and, soon, in every worker"""
+        self.local.delete(key)
+        if self.shared is None:
+            return
+
+        try:
+            await self.shared.delete(self._shared_key(key))
+            version = await self.shared.incr(self._log_key(0))
+            await self.shared.set(self._log_key(version), key.encode(), SHARED_CACHE_LOG_TTL)
+        except Exception as e:
+            self._failed("invalidate", e)
+
+    def clear(self) -> None:
+        """Empty this process's tier; the shared tier is left alone"""
+        self.local.clear()
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        return {
+            **local,
+            "hits": local["hits"] + self.shared_hits,
+            "misses": local["misses"] - self.shared_hits,
+            "shared": self.shared is not None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
+
+
+async def close_shared_tier() -> None:
+    if shared_tier is not None:
+        await shared_tier.aclose()
@@ -0,0 +1,224 @@
+import asyncio
+import contextlib
+import os
+import anyio
+from fastapi.responses import StreamingResponse
+from starlette.types import Message, Receive, Scope, Send
+from typing import AsyncIterator, Optional
+from ai_providers.buffer import StreamBuffer, memory_budget
+
+# Read-ahead between the provider and the client; 0 chunks pulls directly
+STREAM_BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", "32"))
+STREAM_BUFFER_BYTES = int(os.getenv("STREAM_BUFFER_BYTES", str(64 * 1024)))
+# "block" pauses the upstream read when full, "coalesce" merges chunks
+STREAM_OVERFLOW = os.getenv("STREAM_OVERFLOW", "block")
+# SSE frames gather chunks until this many bytes or milliseconds; 0 ms
+# writes one frame per chunk
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "1024"))
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "20"))
+
+
+class StreamStats:
+    """Process-wide counters for SSE streams"""
+
+    def __init__(self):
+        self.active = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.producer_waits = 0
+        self.coalesced_chunks = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self.active,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "producer_waits": self.producer_waits,
+            "coalesced_chunks": self.coalesced_chunks,
+            "buffered_bytes": memory_budget.used,
+            "peak_buffered_bytes": memory_budget.peak,
+            "memory_budget_bytes": memory_budget.limit,
+            "memory_budget_waits": memory_budget.waits,
+        }
+
+
+stream_stats = StreamStats()
+
+
+async def read_ahead(source: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Keep reading the provider while the client is still being written to.
+
+    Chunks wait in a bounded StreamBuffer, so a slow client eventually
+    stalls the upstream read (or gets coalesced chunks) instead of growing
+    memory without limit. Closing this iterator stops the reader and closes
+    `source`, so disconnect cancellation still reaches the provider.
+    """
+    if STREAM_BUFFER_CHUNKS <= 0:
+        try:
+            async for text in source:
+                yield text
+        finally:
+            await source.aclose()
+        return
+
+    buffer = StreamBuffer(STREAM_BUFFER_CHUNKS, STREAM_BUFFER_BYTES, STREAM_OVERFLOW)
+
+    async def produce() -> None:
+        try:
+            async for text in source:
+                await buffer.put(text)
+        except Exception as e:
+            buffer.close(e)
+        else:
+            buffer.close()
+
+    reader = asyncio.create_task(produce())
+    try:
+        async for text in buffer:
+            yield text
+    finally:
+        reader.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await reader
+        await source.aclose()
+        buffer.discard()
+        stream_stats.producer_waits += buffer.blocked
+        stream_stats.coalesced_chunks += buffer.coalesced
+
+
+def format_sse(data: str, event: Optional[str] = None) -> str:
+    """
+    Frame `data` as one SSE event.
+
+    Every line of a multi-line payload gets its own `data:` field, which
+    clients join back with newlines, so the text arrives unchanged.
+    """
+    lines = data.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    frame = "".join(f"data: {line}\n" for line in lines)
+    if event is not None:
+        frame = f"event: {event}\n{frame}"
+    return frame + "\n"
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    flush_bytes: int = SSE_FLUSH_BYTES,
+    flush_ms: float = SSE_FLUSH_MS,
+) -> AsyncIterator[str]:
+    """
+    Merge small chunks so each SSE frame is one write and one packet.
+
+    The first chunk goes out immediately to keep time-to-first-token low.
+    After that text is held until `flush_bytes` have gathered or `flush_ms`
+    have passed since the oldest held chunk, and whatever is held is
+    flushed when the stream ends or fails. The upstream read keeps running
+    while the timer is pending, so waiting never delays the next chunk.
+    """
+    if flush_ms <= 0:
+        try:
+            async for text in source:
+                yield text
+        finally:
+            await source.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    pending = []
+    pending_size = 0
+    deadline = None
+    first = True
+    next_chunk = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(source.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                yield "".join(pending)
+                pending, pending_size, deadline = [], 0, None
+                continue
+
+            task, next_chunk = next_chunk, None
+            try:
+                text = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if pending:
+                    yield "".join(pending)
+                raise
+
+            if first:
+                first = False
+                yield text
+                continue
+            pending.append(text)
+            pending_size += len(text)
+            if pending_size >= flush_bytes:
+                yield "".join(pending)
+                pending, pending_size, deadline = [], 0, None
+            elif deadline is None:
+                deadline = loop.time() + flush_ms / 1000
+
+        if pending:
+            yield "".join(pending)
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await next_chunk
+        await source.aclose()
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    SSE response that stops generating as soon as the client goes away.
+
+    Starlette only watches for `http.disconnect` on older ASGI servers and
+    never closes the body iterator, so an abandoned stream would keep
+    pulling tokens until the model finished. Here the disconnect listener
+    always runs: it cancels the in-flight upstream read, and the iterator is
+    closed so the provider can release its response.
+    """
+
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Servers also send http.disconnect after a complete response, so
+        # only a stream that never finished its body counts as cancelled
+        finished = False
+        stream_stats.active += 1
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def send_body(message: Message) -> None:
+                    nonlocal finished
+                    # The disconnect can arrive while the last message is sent
+                    if message["type"] == "http.response.body" and not message.get("more_body"):
+                        finished = True
+                    await send(message)
+
+                async def stream() -> None:
+                    try:
+                        await self.stream_response(send_body)
+                    except OSError:
+                        # ASGI 2.4 servers report the disconnect on send
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(stream)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+        finally:
+            stream_stats.active -= 1
+            if finished:
+                stream_stats.completed += 1
+            else:
+                stream_stats.cancelled += 1
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+        if self.background is not None:
+            await self.background()
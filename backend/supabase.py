@@ -1,12 +1,171 @@
-from jose import jwt
-from jose.exceptions import JWTError
-from typing import Optional
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import httpx
+from jose import jwk, jwt
+from jose.exceptions import JWKError, JWTError
+from typing import Dict, Optional
+from shared_cache import TwoLevelCache
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+# Legacy projects sign access tokens with this HS256 secret
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+# Local development only: with neither a secret nor a JWKS URL configured,
+# accept tokens without checking their signature instead of rejecting them
+SUPABASE_INSECURE_SKIP_VERIFY = os.getenv("SUPABASE_INSECURE_SKIP_VERIFY", "0") == "1"
+
+# Verified claims keyed by token hash, each kept until the token's exp
+_verified_tokens = TwoLevelCache(
+    "token",
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "3600")),
+)
+
+
+class JWKSCache:
+    """
+    Signing keys from the project's JWKS endpoint.
+
+    Keys are refreshed in the background once they are older than
+    `refresh_interval`, so requests keep verifying against the current set
+    instead of waiting on the fetch. A token signed with an unknown `kid`
+    (key rotation) triggers an immediate, rate-limited refetch.
+    """
+
+    def __init__(self, url: str, refresh_interval: float = 600.0, min_refetch: float = 30.0):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refetch = min_refetch
+        self._keys: Dict[str, object] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> None:
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+
+        keys = {}
+        for key_data in response.json().get("keys", []):
+            try:
+                keys[key_data.get("kid")] = jwk.construct(key_data, key_data.get("alg"))
+            except JWKError as e:
+                logger.warning("Skipping unusable JWKS key: %s", e)
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self, force: bool = False) -> None:
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if not force and self._keys and age < self.refresh_interval:
+                return
+            if force and age < self.min_refetch:
+                return
+            await self._fetch()
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+
+        async def run():
+            try:
+                await self.refresh()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("JWKS refresh failed: %s", e)
+
+        self._refresh_task = asyncio.create_task(run())
+
+    async def get_key(self, kid: Optional[str]):
+        if not self._keys:
+            await self.refresh()
+        elif time.monotonic() - self._fetched_at >= self.refresh_interval:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None:
+            await self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+
+_jwks = (
+    JWKSCache(
+        SUPABASE_JWKS_URL,
+        refresh_interval=float(os.getenv("SUPABASE_JWKS_REFRESH", "600")),
+    )
+    if SUPABASE_JWKS_URL
+    else None
+)
+_warned_unverified = False
+
+
+async def _verify(token: str) -> dict:
+    global _warned_unverified
+
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    options = {"verify_aud": SUPABASE_JWT_AUDIENCE is not None}
+
+    if algorithm == "HS256" and SUPABASE_JWT_SECRET:
+        key = SUPABASE_JWT_SECRET
+    elif algorithm != "HS256" and _jwks is not None:
+        key = await _jwks.get_key(header.get("kid"))
+        if key is None:
+            raise JWTError(f"No signing key found for kid {header.get('kid')!r}")
+    elif not SUPABASE_JWT_SECRET and _jwks is None:
+        if not SUPABASE_INSECURE_SKIP_VERIFY:
+            raise JWTError(
+                "Nothing to verify tokens against: set SUPABASE_JWT_SECRET or SUPABASE_URL"
+            )
+        if not _warned_unverified:
+            logger.warning(
+                "SUPABASE_INSECURE_SKIP_VERIFY is set; JWT signatures are NOT verified"
+            )
+            _warned_unverified = True
+        return jwt.get_unverified_claims(token)
+    else:
+        raise JWTError(f"Unsupported token algorithm {algorithm!r}")
+
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options=options,
+    )
+
 
 async def validate_supabase_token(token: str) -> Optional[dict]:
+    """
+    Verify a Supabase access token and return its claims.
+
+    Verified claims are cached by token hash until the token expires, so
+    the signature is checked once per token rather than once per request.
+    """
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    claims = await _verified_tokens.get(cache_key)
+    if claims is not None:
+        return claims
+
     try:
-        # Just decode without verifying signature
-        payload = jwt.get_unverified_claims(token)
-        return payload
-    except JWTError as e:
-        print("Token decoding failed:", str(e))
+        claims = await _verify(token)
+    except (JWTError, httpx.HTTPError, ValueError) as e:
+        logger.info("Token validation failed: %s", e)
         return None
+
+    ttl = _verified_tokens.ttl
+    exp = claims.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    await _verified_tokens.set(cache_key, claims, ttl=ttl)
+    return claims
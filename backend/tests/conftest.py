@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+# A throwaway database, set before anything imports `database`
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+import migrations  # noqa: E402
+
+migrations.upgrade()
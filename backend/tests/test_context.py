@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from ai_providers import ai_service as ai_service_module
+from ai_providers.ai_service import AIService
+from ai_providers.base import AIProvider, ProviderRegistry
+from ai_providers.context import (
+    SUMMARY_PREFIX,
+    cached_summary,
+    context_budget,
+    fit_context,
+    message_tokens,
+)
+
+
+class SummaryProvider(AIProvider):
+    """Answers every request with a fixed summary, recording the prompts"""
+
+    prompts = []
+
+    async def stream_chat(self, messages, on_chunk):
+        raise NotImplementedError
+
+    async def generate_response(self, messages):
+        self.prompts.append(messages[-1]["content"])
+        return "they talked about turns"
+
+
+class FailingProvider(SummaryProvider):
+    async def generate_response(self, messages):
+        raise RuntimeError("upstream down")
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setitem(ProviderRegistry._providers, "summary", SummaryProvider)
+    monkeypatch.setitem(ProviderRegistry._providers, "failing", FailingProvider)
+    monkeypatch.setattr(ai_service_module, "CONTEXT_SUMMARY", True)
+    SummaryProvider.prompts = []
+    yield
+    asyncio.run(ProviderRegistry.clear_pool())
+
+
+def conversation(turns: int):
+    # About 1000 tokens per turn; gpt-4 leaves a 4096 token prompt budget
+    messages = [{"role": "system", "content": "be brief"}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"turn {i} " + "x" * 4000})
+    return messages
+
+
+def test_short_conversation_is_untouched():
+    messages = conversation(2)
+    assert fit_context(messages, context_budget("gpt-4")) == (messages, 0, 0)
+
+
+def test_oldest_turns_are_dropped_and_system_kept():
+    messages = conversation(9)
+    budget = context_budget("gpt-4")
+    fitted, pinned, start = fit_context(messages, budget)
+    assert pinned == 1
+    assert fitted[0] == messages[0]
+    assert fitted[1:] == messages[start:]
+    assert fitted[1]["role"] == "user"
+    assert fitted[-1] == messages[-1]
+    assert sum(map(message_tokens, fitted)) <= budget
+
+
+def test_dropped_turns_are_summarized(providers):
+    service = AIService()
+    messages = conversation(9)
+
+    async def run():
+        fitted = service._fit_context(messages, "summary", "k", "gpt-4", 1001, "u")
+        assert not any(m["content"].startswith(SUMMARY_PREFIX) for m in fitted)
+        assert len(service._summary_tasks) == 1
+        await asyncio.gather(*service._summary_tasks)
+        assert not service._summary_tasks
+
+        covered, text = cached_summary("1001")
+        assert text == "they talked about turns"
+        _, _, start = fit_context(messages, context_budget("gpt-4"))
+        assert covered == start
+        # The newest dropped turn is summarized, the system prompt is not
+        assert f"turn {start - 2} " in SummaryProvider.prompts[0]
+        assert "be brief" not in SummaryProvider.prompts[0]
+
+        # The next turn sends the summary in place of the dropped turns
+        later = messages + [{"role": "assistant", "content": "ok"}]
+        fitted = service._fit_context(later, "summary", "k", "gpt-4", 1001, "u")
+        assert fitted[1] == {"role": "system", "content": SUMMARY_PREFIX + text}
+        assert fitted[-1] == later[-1]
+        assert sum(map(message_tokens, fitted)) <= context_budget("gpt-4")
+
+    asyncio.run(run())
+
+
+def test_failed_summary_is_logged_and_retried(providers, caplog):
+    service = AIService()
+    messages = conversation(9)
+
+    async def run():
+        service._fit_context(messages, "failing", "k", "gpt-4", 1002, "u")
+        await asyncio.gather(*service._summary_tasks)
+        assert cached_summary("1002") is None
+        assert "Conversation summary failed" in caplog.text
+
+        # The key is released, so the next turn tries again
+        service._fit_context(messages, "failing", "k", "gpt-4", 1002, "u")
+        assert len(service._summary_tasks) == 1
+        await asyncio.gather(*service._summary_tasks)
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+from conversations import (
+    ConversationConflict,
+    append_messages,
+    create_conversation,
+    load_history,
+)
+from database import session_scope
+
+
+def turn(content: str) -> list:
+    return [{"role": "user", "content": content}, {"role": "assistant", "content": "ok"}]
+
+
+def test_overlapping_turns_conflict():
+    async def run():
+        async with session_scope() as db:
+            conversation = await create_conversation(db, "u1")
+
+        # Both turns build their context before either stores its reply
+        async with session_scope() as first_db, session_scope() as second_db:
+            first = await load_history(first_db, "u1", conversation.id)
+            second = await load_history(second_db, "u1", conversation.id)
+
+            await append_messages(first_db, first, turn("first"))
+            with pytest.raises(ConversationConflict):
+                await append_messages(second_db, second, turn("second"))
+
+        async with session_scope() as db:
+            history = await load_history(db, "u1", conversation.id)
+        assert [m["content"] for m in history.messages] == ["first", "ok"]
+
+    asyncio.run(run())
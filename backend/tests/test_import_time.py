@@ -0,0 +1,23 @@
+import os
+from benchmarks.import_time import FORBIDDEN, profile
+
+# Generous, so only a real regression (an SDK loaded eagerly) fails it
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "5000"))
+
+
+def test_import_main_stays_light():
+    # Best of a few cold starts, to ride out a busy machine
+    runs = [profile("main") for _ in range(3)]
+
+    loaded = {name for imports in runs for _, _, name in imports}
+    forbidden = [
+        f for f in FORBIDDEN
+        if any(name == f or name.startswith(f + ".") for name in loaded)
+    ]
+    assert forbidden == [], f"imported at startup: {forbidden}"
+
+    best_ms = min(
+        next(us for us, depth, name in imports if name == "main" and depth == 0)
+        for imports in runs
+    ) / 1000
+    assert best_ms < BUDGET_MS, f"import main took {best_ms:.0f} ms"
@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from ai_providers.errors import InvalidRequest, ProviderTimeout, ProviderUnavailable
+from ai_providers.resilience import Resilience
+
+
+def test_call_retries_transient_failures():
+    async def run():
+        resilience = Resilience(retries=2, hedge=False)
+        attempts = []
+
+        async def start():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ProviderUnavailable("down", retry_after=0)
+            return "ok"
+
+        assert await resilience.call("p", start) == "ok"
+        assert len(attempts) == 3
+        assert resilience.retried == 2
+
+    asyncio.run(run())
+
+
+def test_call_does_not_retry_permanent_failures():
+    async def run():
+        resilience = Resilience(retries=2, hedge=False)
+        attempts = []
+
+        async def start():
+            attempts.append(1)
+            raise InvalidRequest("bad model")
+
+        with pytest.raises(InvalidRequest):
+            await resilience.call("p", start)
+        assert len(attempts) == 1
+
+    asyncio.run(run())
+
+
+def test_stream_retries_until_the_first_chunk_only():
+    async def run():
+        resilience = Resilience(retries=2, hedge=False)
+        opened = []
+
+        async def upstream():
+            opened.append(1)
+            if len(opened) == 1:
+                raise ProviderUnavailable("down", retry_after=0)
+            yield "a"
+            raise ProviderUnavailable("dropped", retry_after=0)
+
+        chunks = []
+        with pytest.raises(ProviderUnavailable, match="dropped"):
+            async for text in resilience.stream("p", upstream):
+                chunks.append(text)
+        # The failure after "a" is not retried: the client already has it
+        assert chunks == ["a"]
+        assert len(opened) == 2
+
+    asyncio.run(run())
+
+
+def test_hedge_loser_is_cancelled():
+    async def run():
+        resilience = Resilience(retries=0, hedge=True)
+        resilience.hedge_delay = lambda provider_id: 0.01
+        started, cancelled = [], []
+
+        async def start():
+            attempt = len(started)
+            started.append(attempt)
+            try:
+                # The first attempt is slow, so the hedge wins
+                await asyncio.sleep(1 if attempt == 0 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return f"attempt {attempt}"
+
+        assert await resilience.call("p", start) == "attempt 1"
+        await asyncio.sleep(0)
+        assert cancelled == [0]
+        assert (resilience.hedged, resilience.hedge_wins) == (1, 1)
+
+    asyncio.run(run())
+
+
+def test_hedged_stream_closes_the_losing_stream():
+    async def run():
+        resilience = Resilience(retries=0, hedge=True)
+        resilience.hedge_delay = lambda provider_id: 0.01
+        opened, closed = [], []
+
+        def start():
+            attempt = len(opened)
+            opened.append(attempt)
+
+            async def upstream():
+                try:
+                    await asyncio.sleep(1 if attempt == 0 else 0.01)
+                    yield f"from {attempt}"
+                finally:
+                    closed.append(attempt)
+            return upstream()
+
+        chunks = [text async for text in resilience.stream("p", start)]
+        await asyncio.sleep(0.01)
+        assert chunks == ["from 1"]
+        assert sorted(closed) == [0, 1]
+
+    asyncio.run(run())
+
+
+def test_stalled_stream_times_out():
+    async def run():
+        resilience = Resilience(retries=0, hedge=False, idle_timeout=0.05)
+
+        async def upstream():
+            yield "a"
+            await asyncio.sleep(1)
+            yield "b"
+
+        chunks = []
+        with pytest.raises(ProviderTimeout, match="stalled"):
+            async for text in resilience.stream("p", upstream):
+                chunks.append(text)
+        assert chunks == ["a"]
+        assert resilience.timeouts == 1
+
+    asyncio.run(run())
+
+
+def test_slow_reader_does_not_trip_the_idle_timeout():
+    async def run():
+        resilience = Resilience(retries=0, hedge=False, idle_timeout=0.05)
+
+        async def upstream():
+            for i in range(3):
+                yield str(i)
+
+        chunks = []
+        async for text in resilience.stream("p", upstream):
+            chunks.append(text)
+            await asyncio.sleep(0.1)
+        assert chunks == ["0", "1", "2"]
+        assert resilience.timeouts == 0
+
+    asyncio.run(run())
+
+
+def test_first_token_deadline():
+    async def run():
+        resilience = Resilience(retries=0, hedge=False, first_token_timeout=0.05)
+
+        async def upstream():
+            await asyncio.sleep(1)
+            yield "late"
+
+        with pytest.raises(ProviderTimeout, match="sent nothing"):
+            async for _ in resilience.stream("p", upstream):
+                pass
+
+    asyncio.run(run())
@@ -0,0 +1,152 @@
+import asyncio
+import pytest
+from ai_providers import scheduler as scheduler_module
+from ai_providers.scheduler import QueueTimeout, Scheduler, TokenBucket
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Set the limits of provider "p" for one test"""
+    def set_limits(**values):
+        monkeypatch.setitem(scheduler_module.PROVIDER_LIMITS, "p", values)
+    return set_limits
+
+
+async def hold(scheduler: Scheduler, user: str, order: list, seconds: float = 0.01, key="k"):
+    async with scheduler.slot("p", key, user, tokens=1):
+        order.append(user)
+        await asyncio.sleep(seconds)
+
+
+def test_users_are_served_in_turn(limits):
+    limits(key_concurrency=1)
+
+    async def run():
+        scheduler = Scheduler()
+        order = []
+        burst = [asyncio.create_task(hold(scheduler, "a", order)) for _ in range(6)]
+        await asyncio.sleep(0)
+        other = asyncio.create_task(hold(scheduler, "b", order))
+        await asyncio.gather(*burst, other)
+        # b takes the next turn after the user already queued, rather than
+        # waiting behind a's whole burst
+        assert order == ["a", "a", "b", "a", "a", "a", "a"]
+
+    asyncio.run(run())
+
+
+def test_key_concurrency_is_enforced(limits):
+    limits(key_concurrency=2)
+
+    async def run():
+        scheduler = Scheduler()
+        running, peak = 0, 0
+
+        async def call(user):
+            nonlocal running, peak
+            async with scheduler.slot("p", "k", user, tokens=1):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call(f"u{i % 3}") for i in range(7)))
+        assert peak == 2
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_keys_have_separate_limits(limits):
+    limits(key_concurrency=1)
+
+    async def run():
+        scheduler = Scheduler()
+        order = []
+        async with scheduler.slot("p", "k1", "a", tokens=1):
+            # Another key is not held up by k1's busy slot
+            await asyncio.wait_for(hold(scheduler, "b", order, key="k2"), 0.1)
+        assert order == ["b"]
+
+    asyncio.run(run())
+
+
+def test_rpm_limit_rejects_after_max_wait(limits):
+    limits(rpm=2)
+
+    async def run():
+        scheduler = Scheduler(max_wait=0.05)
+        order = []
+        await hold(scheduler, "a", order, 0)
+        await hold(scheduler, "a", order, 0)
+        # The bucket refills one request every 30 seconds
+        with pytest.raises(QueueTimeout):
+            await hold(scheduler, "a", order, 0)
+        assert order == ["a", "a"]
+        assert scheduler.stats()["rejected"] == 1
+        assert scheduler.stats()["waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket_refills_and_lets_oversized_requests_into_debt():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1)
+    assert bucket.wait_time(1, now + 1) == 0
+
+    # Larger than the whole bucket: allowed once it is full, then owed
+    assert bucket.wait_time(600, now + 60) == 0
+    bucket.take(600)
+    assert bucket.wait_time(1, now + 60) == pytest.approx(541)
+
+
+def test_cancelled_waiter_gives_up_its_place(limits):
+    limits(key_concurrency=1)
+
+    async def run():
+        scheduler = Scheduler()
+        order = []
+        holder = asyncio.create_task(hold(scheduler, "a", order, 0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(scheduler, "b", order))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["waiting"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.stats()["waiting"] == 0
+
+        await holder
+        await hold(scheduler, "c", order)
+        assert order == ["a", "c"]
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_waiter_cancelled_as_it_is_granted_releases_the_slot(limits):
+    limits(key_concurrency=1)
+
+    async def run():
+        scheduler = Scheduler()
+        order = []
+        slot = scheduler.slot("p", "k", "a", tokens=1)
+        await slot.__aenter__()
+        waiter = asyncio.create_task(hold(scheduler, "b", order))
+        await asyncio.sleep(0.01)
+
+        # Releasing grants the waiter's slot before the waiter gets to run
+        await slot.__aexit__(None, None, None)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert order == []
+        assert scheduler.stats()["running"] == 0
+
+        await asyncio.wait_for(hold(scheduler, "c", order), 0.1)
+        assert order == ["c"]
+
+    asyncio.run(run())
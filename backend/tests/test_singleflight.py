@@ -0,0 +1,103 @@
+import asyncio
+from ai_providers.buffer import memory_budget
+from ai_providers.singleflight import SingleFlight
+
+
+def counting_source(produced: list, chunks: int, size: int = 10):
+    async def source():
+        for i in range(chunks):
+            produced.append(i)
+            yield str(i).rjust(size, "-")
+            await asyncio.sleep(0)
+    return source
+
+
+async def read(stream, delay: float = 0) -> list:
+    chunks = []
+    async for text in stream:
+        chunks.append(text)
+        await asyncio.sleep(delay)
+    return chunks
+
+
+def test_identical_streams_share_one_upstream():
+    async def run():
+        flights = SingleFlight()
+        produced = []
+        start = counting_source(produced, 20)
+        results = await asyncio.gather(
+            read(flights.stream("k", start)),
+            read(flights.stream("k", start)),
+            read(flights.stream("other", counting_source([], 20))),
+        )
+        assert results[0] == results[1] == results[2]
+        assert len(results[0]) == 20
+        assert produced == list(range(20))
+        assert flights.stats() == {"in_flight": 0, "started": 2, "joined": 1}
+
+    asyncio.run(run())
+
+
+def test_late_joiner_replays_from_the_start():
+    async def run():
+        flights = SingleFlight()
+        first = flights.stream("k", counting_source([], 5))
+        head = await first.__anext__()
+        rest, joined = await asyncio.gather(read(first), read(flights.stream("k", None)))
+        assert [head, *rest] == joined
+        assert flights.joined == 1
+
+    asyncio.run(run())
+
+
+def test_upstream_is_paced_by_the_slowest_reader():
+    async def run():
+        flights = SingleFlight(max_bytes=100)
+        produced = []
+        stream = flights.stream("k", counting_source(produced, 20000))
+        for _ in range(5):
+            await stream.__anext__()
+            await asyncio.sleep(0.001)
+        # The buffer holds 10 chunks; the upstream stays just ahead of it
+        assert len(produced) <= 5 + 12
+        assert memory_budget.used <= 100
+        await stream.aclose()
+        assert memory_budget.used == 0
+
+    asyncio.run(run())
+
+
+def test_full_flight_stops_taking_joiners():
+    async def run():
+        flights = SingleFlight(max_bytes=30)
+        produced = []
+        first = flights.stream("k", counting_source(produced, 10))
+        for _ in range(5):
+            await first.__anext__()
+        # Its first chunks are gone, so a duplicate gets its own upstream
+        second = flights.stream("k", counting_source([], 10))
+        assert len(await read(second)) == 10
+        assert flights.stats()["started"] == 2
+        assert len(await read(first)) == 5
+        assert memory_budget.used == 0
+
+    asyncio.run(run())
+
+
+def test_error_reaches_every_subscriber():
+    async def run():
+        flights = SingleFlight()
+
+        async def failing():
+            yield "a"
+            raise RuntimeError("upstream failed")
+
+        async def collect():
+            try:
+                await read(flights.stream("k", failing))
+            except RuntimeError as e:
+                return str(e)
+
+        assert await asyncio.gather(collect(), collect()) == ["upstream failed"] * 2
+
+    asyncio.run(run())
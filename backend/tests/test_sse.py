@@ -0,0 +1,61 @@
+import pytest
+from ai_providers.sse import NDJSONDecoder, SSEDecoder, SSEEvent
+
+STREAMS = {
+    "lf": b'data: {"x":1}\n\ndata: {"x":2}\n\n',
+    "crlf": b'data: {"x":1}\r\n\r\ndata: {"x":2}\r\n\r\n',
+}
+
+
+def feed_all(decoder, data: bytes, size: int) -> list:
+    items = []
+    for i in range(0, len(data), size):
+        items += decoder.feed(data[i:i + size])
+    return items
+
+
+@pytest.mark.parametrize("line_ending", STREAMS)
+def test_terminator_split_at_every_byte(line_ending):
+    data = STREAMS[line_ending]
+    for split in range(1, len(data)):
+        decoder = SSEDecoder()
+        events = decoder.feed(data[:split]) + decoder.feed(data[split:])
+        assert [e.json() for e in events] == [{"x": 1}, {"x": 2}], split
+
+
+@pytest.mark.parametrize("line_ending", STREAMS)
+def test_one_byte_reads(line_ending):
+    events = feed_all(SSEDecoder(), STREAMS[line_ending], 1)
+    assert [e.json() for e in events] == [{"x": 1}, {"x": 2}]
+
+
+def test_multiline_events_fields_and_comments():
+    data = (
+        b": keep-alive\r\n\r\n"
+        b"event: message_start\r\nid: 7\r\ndata: a\r\ndata: b\r\n\r\n"
+        b"data:no-space\n\n"
+    )
+    events = feed_all(SSEDecoder(), data, 5)
+    assert events == [
+        SSEEvent("message_start", b"a\nb", "7"),
+        SSEEvent(None, b"no-space", "7"),
+    ]
+
+
+def test_bare_data_line_is_an_empty_event():
+    assert SSEDecoder().feed(b"data\n\n") == [SSEEvent(None, b"", None)]
+    assert SSEDecoder().feed(b"event: ping\ndata\n\n") == [SSEEvent("ping", b"", None)]
+
+
+def test_unterminated_event_is_dropped():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: 1\n\ndata: 2\n") == [SSEEvent(None, b"1", None)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_ndjson(size):
+    data = b'{"a":1}\r\n\n{"b":[1,2]}\n{"c":"\\u00e9"}'
+    decoder = NDJSONDecoder()
+    objects = feed_all(decoder, data, size) + decoder.flush()
+    assert objects == [{"a": 1}, {"b": [1, 2]}, {"c": "é"}]
+    assert decoder.flush() == []
@@ -0,0 +1,59 @@
+import asyncio
+from streaming import EventStreamResponse, stream_stats
+
+
+def call(response: EventStreamResponse, disconnect_after: float = None) -> list:
+    """
+    Run the response as uvicorn would: the client leaves after
+    `disconnect_after` seconds, or else once the body is complete.
+    """
+    sent = []
+    body_complete = asyncio.Event()
+
+    async def receive():
+        if disconnect_after is None:
+            await body_complete.wait()
+        else:
+            await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            body_complete.set()
+        # Writing to the transport yields to the event loop
+        await asyncio.sleep(0)
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    asyncio.run(response(scope, receive, send))
+    return sent
+
+
+def test_complete_stream_counts_as_completed():
+    async def frames():
+        yield "data: a\n\n"
+        yield "data: b\n\n"
+
+    completed, cancelled = stream_stats.completed, stream_stats.cancelled
+    sent = call(EventStreamResponse(frames()))
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+    assert stream_stats.completed == completed + 1
+    assert stream_stats.cancelled == cancelled
+
+
+def test_disconnect_mid_stream_cancels_the_body():
+    closed = []
+
+    async def frames():
+        try:
+            while True:
+                yield "data: x\n\n"
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(True)
+
+    completed, cancelled = stream_stats.completed, stream_stats.cancelled
+    call(EventStreamResponse(frames()), disconnect_after=0.05)
+    assert closed == [True]
+    assert stream_stats.cancelled == cancelled + 1
+    assert stream_stats.completed == completed
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+import supabase
+from supabase import JWKSCache, validate_supabase_token
+
+SECRET = "test-secret"
+
+
+def claims(**extra):
+    return {"sub": "user-1", "exp": int(time.time()) + 300, **extra}
+
+
+def rsa_key():
+    """(private PEM, public JWK) of a fresh RSA key"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private, jwk.construct(public, "RS256").to_dict()
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    """Configure verification for one test, starting from nothing configured"""
+    monkeypatch.setattr(supabase, "SUPABASE_JWT_SECRET", None)
+    monkeypatch.setattr(supabase, "SUPABASE_JWT_AUDIENCE", None)
+    monkeypatch.setattr(supabase, "SUPABASE_INSECURE_SKIP_VERIFY", False)
+    monkeypatch.setattr(supabase, "_jwks", None)
+    supabase._verified_tokens.clear()
+
+    def configure(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(supabase, name, value)
+    yield configure
+    supabase._verified_tokens.clear()
+
+
+@pytest.fixture
+def jwks(auth, monkeypatch):
+    """Serve a JWKS with one RS256 key, kid "k1"; returns its private key and fetch count"""
+    private, public = rsa_key()
+    fetches = []
+
+    def handler(request):
+        fetches.append(request.url)
+        return httpx.Response(200, json={"keys": [{**public, "kid": "k1", "alg": "RS256"}]})
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(
+        supabase.httpx,
+        "AsyncClient",
+        lambda **kwargs: client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    auth(_jwks=JWKSCache("https://project.supabase.co/auth/v1/.well-known/jwks.json"))
+    return private, fetches
+
+
+def validate(token):
+    return asyncio.run(validate_supabase_token(token))
+
+
+def test_hs256_token_is_accepted(auth):
+    auth(SUPABASE_JWT_SECRET=SECRET)
+    assert validate(jwt.encode(claims(), SECRET, algorithm="HS256"))["sub"] == "user-1"
+
+
+def test_hs256_token_with_wrong_secret_is_rejected(auth):
+    auth(SUPABASE_JWT_SECRET=SECRET)
+    assert validate(jwt.encode(claims(), "other-secret", algorithm="HS256")) is None
+
+
+def test_expired_token_is_rejected(auth):
+    auth(SUPABASE_JWT_SECRET=SECRET)
+    token = jwt.encode(claims(exp=int(time.time()) - 10), SECRET, algorithm="HS256")
+    assert validate(token) is None
+
+
+def test_audience_is_checked_when_configured(auth):
+    auth(SUPABASE_JWT_SECRET=SECRET, SUPABASE_JWT_AUDIENCE="authenticated")
+    assert validate(jwt.encode(claims(aud="authenticated"), SECRET, algorithm="HS256"))
+    assert validate(jwt.encode(claims(aud="anon"), SECRET, algorithm="HS256")) is None
+
+
+def test_jwks_token_is_accepted(jwks):
+    private, fetches = jwks
+    token = jwt.encode(claims(), private, algorithm="RS256", headers={"kid": "k1"})
+    assert validate(token)["sub"] == "user-1"
+    assert len(fetches) == 1
+
+
+def test_jwks_token_signed_by_another_key_is_rejected(jwks):
+    other, _ = rsa_key()
+    token = jwt.encode(claims(), other, algorithm="RS256", headers={"kid": "k1"})
+    assert validate(token) is None
+
+
+def test_jwks_token_with_unknown_kid_is_rejected(jwks):
+    private, _ = jwks
+    token = jwt.encode(claims(), private, algorithm="RS256", headers={"kid": "k2"})
+    assert validate(token) is None
+
+
+def test_hs256_token_is_rejected_when_only_jwks_is_configured(jwks):
+    # The public key must not double as an HMAC secret
+    assert validate(jwt.encode(claims(), SECRET, algorithm="HS256")) is None
+
+
+def test_unverifiable_token_is_rejected_by_default(auth):
+    assert validate(jwt.encode(claims(), SECRET, algorithm="HS256")) is None
+
+
+def test_insecure_mode_accepts_unverified_tokens(auth):
+    auth(SUPABASE_INSECURE_SKIP_VERIFY=True)
+    assert validate(jwt.encode(claims(), "anything", algorithm="HS256"))["sub"] == "user-1"
@@ -0,0 +1,151 @@
+"""
+Background worker for POST /jobs.
+
+Claims queued chat jobs from the chat_jobs table and answers them the way
+POST /chat would, JOB_WORKER_CONCURRENCY at a time. The database is the
+queue, so any number of workers can run, on other machines than the API
+too. SIGTERM stops claiming and lets running jobs finish:
+
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import signal
+import uuid
+from chat import ChatRequestError, chat_reply
+from conversations import ConversationConflict
+from database import session_scope
+from jobs import JOB_LEASE, claim_job, finish_job, renew_claim, sweep_jobs
+from logging_config import configure_logging
+from model_resolver import resolve_selected_model
+from models import ChatJob
+from schema import ChatRequest
+from shared_cache import close_shared_tier
+from ai_providers.errors import ProviderError
+from ai_providers.http_client import close_http_client
+from ai_providers.providers import ProviderRegistry
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+# Seconds between polls while the queue is empty
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Seconds between sweeps for abandoned and expired jobs
+JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", "60"))
+
+logger = logging.getLogger("worker")
+
+
+async def answer(job: ChatJob) -> dict:
+    """finish_job arguments for the job's outcome"""
+    try:
+        data = ChatRequest.model_validate_json(job.request)
+        # The model selected when the job runs, as for a delayed /chat
+        async with session_scope() as db:
+            selected = await resolve_selected_model(db, job.user_id)
+        if not selected:
+            raise ChatRequestError(404, "No selected model found")
+        if not selected.found:
+            raise ChatRequestError(404, "Model not found")
+        if not selected.api_key:
+            raise ChatRequestError(400, "API key is missing for the selected model")
+
+        async with session_scope() as db:
+            result = await chat_reply(db, job.user_id, selected, data)
+    except ChatRequestError as e:
+        return {"error": e.error, "error_status": e.status_code}
+    except ConversationConflict:
+        return {"error": "Conversation was modified concurrently", "error_status": 409}
+    except ProviderError as e:
+        return {"error": str(e), "error_status": e.status_code}
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        return {"error": str(e), "error_status": 500}
+
+    conversation_id = result.get("conversation_id")
+    return {
+        "response": result["response"],
+        "conversation_id": uuid.UUID(conversation_id) if conversation_id else None,
+    }
+
+
+async def keep_claim(job: ChatJob) -> None:
+    """Renew the job's claim until cancelled"""
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        async with session_scope() as db:
+            if not await renew_claim(db, job):
+                logger.warning("Job %s was taken over by another worker", job.id)
+                return
+
+
+async def run(job: ChatJob) -> None:
+    renewing = asyncio.create_task(keep_claim(job))
+    try:
+        outcome = await answer(job)
+    finally:
+        renewing.cancel()
+
+    async with session_scope() as db:
+        if not await finish_job(db, job, **outcome):
+            logger.warning("Dropped the result of job %s, which another worker took over", job.id)
+            return
+    logger.info(
+        "Job %s %s",
+        job.id,
+        "failed" if "error" in outcome else "succeeded",
+        extra={"job_id": str(job.id), "attempt": job.attempts},
+    )
+
+
+async def work(stopping: asyncio.Event) -> None:
+    """Claim and run jobs one at a time until `stopping` is set"""
+    while not stopping.is_set():
+        try:
+            async with session_scope() as db:
+                job = await claim_job(db)
+        except Exception:
+            logger.exception("Could not claim a job")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run(job)
+
+
+async def sweep() -> None:
+    while True:
+        try:
+            async with session_scope() as db:
+                failed = await sweep_jobs(db)
+            if failed:
+                logger.warning("Failed %d jobs abandoned by their workers", failed)
+        except Exception:
+            logger.exception("Job sweep failed")
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+
+
+async def serve(concurrency: int = JOB_WORKER_CONCURRENCY) -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    logger.info("Worker started, running up to %d jobs at once", concurrency)
+    sweeping = asyncio.create_task(sweep())
+    try:
+        await asyncio.gather(*(work(stopping) for _ in range(concurrency)))
+    finally:
+        sweeping.cancel()
+        await ProviderRegistry.clear_pool()
+        await close_http_client()
+        await close_shared_tier()
+    logger.info("Worker stopped")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(serve())